@@ -8,4 +8,11 @@ class WomenSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Women
-        fields = ("id", "title", "slug", "cat", "author", "tags")
\ No newline at end of file
+        fields = ("id", "title", "slug", "cat", "author", "tags")
+
+
+class TrendingPostSerializer(serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
+    title = serializers.CharField(read_only=True)
+    slug = serializers.SlugField(read_only=True)
+    score = serializers.FloatField(read_only=True)
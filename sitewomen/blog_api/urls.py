@@ -3,7 +3,7 @@ from rest_framework import routers
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView, TokenVerifyView
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 
-from .views import WomenAPIUpdate, WomenAPIList, WomenAPIDestroy
+from .views import WomenAPIUpdate, WomenAPIList, WomenAPIDestroy, TrendingAPIList
 from .views import WomenViewSet
 
 
@@ -14,6 +14,7 @@ urlpatterns = [
     path('women/', WomenAPIList.as_view()),
     path('women/<int:pk>/', WomenAPIUpdate.as_view()),
     path('women_delete/<int:pk>/', WomenAPIDestroy.as_view()),
+    path('trending/', TrendingAPIList.as_view(), name='trending'),
     path("session_auth/", include("rest_framework.urls")),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, viewsets
@@ -5,12 +6,13 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.decorators import action
-from rest_framework.generics import RetrieveUpdateAPIView, ListCreateAPIView, RetrieveDestroyAPIView
+from rest_framework.generics import RetrieveUpdateAPIView, ListCreateAPIView, RetrieveDestroyAPIView, ListAPIView
 from rest_framework.pagination import PageNumberPagination
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
 from women.models import Women, Category
-from .serializers import WomenSerializer
+from women.trending import get_trending
+from .serializers import WomenSerializer, TrendingPostSerializer
 from .permissions import IsAdminOrReadOnly, IsOwnerOrReadOnly
 
 
@@ -57,3 +59,16 @@ class WomenAPIDestroy(RetrieveDestroyAPIView):
     queryset = Women.published.all()
     serializer_class = WomenSerializer
     permission_classes = (IsAdminOrReadOnly, )
+
+
+class TrendingAPIList(ListAPIView):
+    serializer_class = TrendingPostSerializer
+    pagination_class = None
+    max_limit = 50
+
+    def get_queryset(self):
+        try:
+            limit = min(max(int(self.request.query_params.get("limit", settings.TRENDING_LIMIT)), 1), self.max_limit)
+        except ValueError:
+            limit = settings.TRENDING_LIMIT
+        return get_trending(limit)
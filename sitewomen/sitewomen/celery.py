@@ -18,5 +18,17 @@ app.conf.beat_schedule = {
     'delete-old-posts': {
         'task': 'women.tasks.delete_old_posts',
         'schedule': crontab(minute=59, hour=23),
+    },
+    'flush-page-views': {
+        'task': 'women.tasks.flush_page_views',
+        'schedule': crontab(minute='*'),
+    },
+    'reconcile-counters': {
+        'task': 'women.tasks.reconcile_counters',
+        'schedule': crontab(minute=30, hour=3),
+    },
+    'build-covisitation': {
+        'task': 'women.tasks.build_covisitation',
+        'schedule': crontab(minute=0, hour=4),
     }
 }
\ No newline at end of file
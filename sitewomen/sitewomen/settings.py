@@ -334,4 +334,90 @@ BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 3600}
 CELERY_RESULT_BACKEND = 'redis://' + REDIS_HOST + ':' + REDIS_PORT + '/2'
 
 if os.getenv('CSRF_TRUSTED_ORIGINS'):
-    CSRF_TRUSTED_ORIGINS = os.getenv('CSRF_TRUSTED_ORIGINS').split(' ')
\ No newline at end of file
+    CSRF_TRUSTED_ORIGINS = os.getenv('CSRF_TRUSTED_ORIGINS').split(' ')
+
+TAGGED_CACHE_TIMEOUT = 60 * 15
+# How long concurrent requests wait for another request to fill the same cache entry
+SINGLE_FLIGHT_TIMEOUT = 10
+
+# "offset" - numbered pages, "keyset" - cursor pages ordered by time of creation
+LISTING_PAGINATION = "offset"
+# Above this many rows (by the planner's estimate) listings show an approximate total
+PAGINATOR_ESTIMATE_THRESHOLD = 10000
+# How long the last count of a listing is remembered to decide whether to ask the planner
+PAGINATOR_LAST_COUNT_TIMEOUT = 60 * 60 * 24
+
+# PostgreSQL text search configuration per content language (there is no Belarusian one)
+SEARCH_CONFIGS = {
+    "en": "english",
+    "ru": "russian",
+    "be": "simple",
+}
+
+# Search-as-you-type: number of suggestions of each kind, how often (in seconds)
+# a process checks whether its in-memory index was outdated by another process,
+# and how long the changes are kept in the cache for other processes to replay
+SUGGEST_LIMIT = 8
+SUGGEST_CHECK_INTERVAL = 5
+SUGGEST_CHANGE_TIMEOUT = 60 * 60
+
+# Post views are counted in the cache and written to the database every minute by women.tasks.flush_page_views
+PAGEVIEW_BUFFER_TIMEOUT = 60 * 60 * 48
+PAGEVIEW_IGNORED_USER_AGENTS = r"bot|crawl|spider|slurp|preview|facebookexternalhit|curl|wget|python-requests|headless"
+# Daily totals always go to PostViewDaily; raw PageVisit rows are only kept for analysis
+PAGEVIEW_STORE_VISITS = True
+# Visits (page, visitor, time) wait for the flush in Redis lists, one per day and slot
+PAGEVIEW_REDIS_URL = 'redis://' + REDIS_HOST + ':' + REDIS_PORT + '/3'
+PAGEVIEW_VISIT_SLOTS = 16
+# Raw visits are kept this many days; on PostgreSQL they live in daily partitions created this many days ahead
+PAGEVIEW_RETENTION_DAYS = 30
+PAGEVIEW_PARTITIONS_AHEAD = 7
+
+# Number of similar posts stored for every post by women.related
+RELATED_POSTS_COUNT = 10
+# Content-based similar posts: hashed TF-IDF vectors of every language, memory-mapped from this directory,
+# which the celery workers share; only the rebuild_related_posts command builds them
+RELATED_CONTENT_DIR = BASE_DIR / "related_content"
+RELATED_CONTENT_DIMENSIONS = 1024
+RELATED_CONTENT_BATCH_SIZE = 256
+# Share of the tag score when blending it with the content score on the post page
+RELATED_POSTS_TAG_WEIGHT = 0.5
+
+# Anonymous visitor id stored with every PageVisit, used by the co-visitation job
+VISITOR_COOKIE_NAME = "visitor"
+VISITOR_COOKIE_AGE = 60 * 60 * 24 * 365
+# "Readers also viewed": women.covisitation reads the visits of the last COVISIT_DAYS days every night and keeps
+# the COVISIT_LIMIT best posts of every post seen together by at least COVISIT_MIN_COUNT visitors
+COVISIT_DAYS = 30
+COVISIT_LIMIT = 10
+COVISIT_MIN_COUNT = 2
+COVISIT_MAX_VISITOR_POSTS = 50
+# Pairs are reduced in chunks of this size; more shards mean less memory and more passes over the visits
+COVISIT_CHUNK_PAIRS = 5_000_000
+COVISIT_SHARDS = 1
+
+# "Popular now": events weighted by counter field and halved every TRENDING_HALF_LIFE hours, see women.trending
+TRENDING_HALF_LIFE = 24
+TRENDING_WEIGHTS = {"views_count": 1, "likes": 5, "comments_count": 10}
+TRENDING_LIMIT = 5
+TRENDING_CACHE_TIMEOUT = 60
+
+# Unique visitors are counted with HyperLogLog sketches of 2 ** HLL_PRECISION bytes (about 3% error at 10)
+HLL_PRECISION = 10
+
+# Threads shown on the post page and in every page loaded by "Show more comments"
+COMMENTS_PAGE_SIZE = 20
+
+# fastText language identification model, loaded once per process by women.langid
+FASTTEXT_MODEL_PATH = BASE_DIR / "fasttext_models" / "lid.176.bin"
+
+# Machine translation backend of women.translators; OfflineTranslator needs no network
+TRANSLATOR_BACKEND = "women.translators.GoogleTranslator"
+TRANSLATOR_TIMEOUT = 10
+TRANSLATOR_CONCURRENCY = 8
+# Translations already made are reused from women.translation_memory, the ones in use are cached this long
+TRANSLATION_MEMORY_CACHE_TIMEOUT = 60 * 60 * 24
+# Translation jobs wait this many seconds after the commit; a newer edit in the meantime replaces them
+TRANSLATION_DEBOUNCE = 5
+# How long the version of the latest translation job of a field is kept, well above TRANSLATION_DEBOUNCE
+TRANSLATION_VERSION_TIMEOUT = 60 * 60
@@ -0,0 +1,32 @@
+document.addEventListener("click", event => {
+    const button = event.target.closest("#comments-more, .btn-replies");
+    if (!button) {
+        return;
+    }
+
+    button.disabled = true;
+    fetch(button.dataset.url, {headers: {"X-Requested-With": "XMLHttpRequest"}})
+        .then(response => response.json())
+        .then(data => {
+            if (button.id === "comments-more") {
+                document.querySelector(".nested-comments").insertAdjacentHTML("beforeend", data.html);
+                if (data.next) {
+                    button.dataset.url = data.next;
+                    button.disabled = false;
+                }
+                else {
+                    button.remove();
+                }
+            }
+            else {
+                button.insertAdjacentHTML("afterend", data.html);
+                button.remove();
+            }
+            if (typeof replyUser === "function") {
+                replyUser();
+            }
+        })
+        .catch(() => {
+            button.disabled = false;
+        });
+});
@@ -0,0 +1,25 @@
+let suggestTimer = null;
+
+document.addEventListener("input", event => {
+    const input = event.target;
+    const form = input.closest("form[data-suggest-url]");
+    if (!form || !input.list) {
+        return;
+    }
+
+    clearTimeout(suggestTimer);
+    suggestTimer = setTimeout(() => {
+        const query = input.value.trim();
+        if (!query) {
+            input.list.replaceChildren();
+            return;
+        }
+
+        fetch(`${form.dataset.suggestUrl}?q=${encodeURIComponent(query)}`)
+            .then(response => response.json())
+            .then(data => {
+                const labels = new Set([...data.posts, ...data.tags, ...data.categories].map(item => item.label));
+                input.list.replaceChildren(...[...labels].map(label => new Option(label)));
+            });
+    }, 150);
+});
@@ -89,6 +89,12 @@ class WomenAdmin(admin.ModelAdmin):
     list_filter = ("cat__name", "is_published", MarriedFilter, ContentFilter)
     save_on_top = True
 
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.save(update_fields=obj.get_edit_fields())
+        else:
+            super().save_model(request, obj, form, change)
+
     @admin.display(description=_("Brief description"), ordering=Length("content"))
     def brief_info(self, women: Women):
         count = len(women.content)
@@ -6,3 +6,6 @@ class WomenConfig(AppConfig):
     verbose_name = _("Famous Women of the World")
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'women'
+
+    def ready(self):
+        import women.signals
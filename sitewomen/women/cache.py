@@ -0,0 +1,144 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+TAG_VERSION_KEY = "cache_tag:{}"
+
+POSTS_TAG = "posts"
+CATALOG_TAG = "catalog"
+SUGGEST_TAG = "suggest"
+
+
+def post_tag(pk) -> str:
+    return f"post:{pk}"
+
+
+def category_tag(pk) -> str:
+    return f"category:{pk}"
+
+
+def tag_tag(pk) -> str:
+    return f"tag:{pk}"
+
+
+def comments_tag(pk) -> str:
+    return f"comments:{pk}"
+
+
+def _new_version() -> int:
+    # A fresh counter must never collide with a version that was evicted,
+    # otherwise entries stored under the old version would come back to life.
+    return time.time_ns()
+
+
+def get_tag_versions(tags) -> list[int]:
+    keys = [TAG_VERSION_KEY.format(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, _new_version(), timeout=None)
+        versions.update(cache.get_many(missing))
+    return [versions[key] for key in keys]
+
+
+def make_tagged_key(key: str, tags) -> str:
+    tags = sorted(set(tags))
+    versions = get_tag_versions(tags)
+    digest = hashlib.md5(":".join(f"{tag}={version}" for tag, version in zip(tags, versions)).encode())
+    return f"{key}:{digest.hexdigest()}"
+
+
+def get_tagged(key: str, tags, default=None):
+    return cache.get(make_tagged_key(key, tags), default)
+
+
+def set_tagged(key: str, value, tags, timeout=None) -> None:
+    if timeout is None:
+        timeout = settings.TAGGED_CACHE_TIMEOUT
+    cache.set(make_tagged_key(key, tags), value, timeout)
+
+
+def get_or_set(key: str, default, tags, timeout=None):
+    if timeout is None:
+        timeout = settings.TAGGED_CACHE_TIMEOUT
+    return cache.get_or_set(make_tagged_key(key, tags), default, timeout)
+
+
+def get_or_set_once(key: str, default, tags, timeout=None):
+    """Like get_or_set, but only one caller computes a missing value.
+
+    Concurrent callers wait for the lock holder to store the value instead of
+    repeating the same work. If the holder does not finish within
+    SINGLE_FLIGHT_TIMEOUT seconds, the waiter computes the value itself.
+    """
+    if timeout is None:
+        timeout = settings.TAGGED_CACHE_TIMEOUT
+    tagged_key = make_tagged_key(key, tags)
+    value = cache.get(tagged_key)
+    if value is not None:
+        return value
+
+    lock_key = f"{tagged_key}:lock"
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_TIMEOUT
+    locked = cache.add(lock_key, 1, settings.SINGLE_FLIGHT_TIMEOUT)
+    while not locked and time.monotonic() < deadline:
+        time.sleep(0.05)
+        value = cache.get(tagged_key)
+        if value is not None:
+            return value
+        locked = cache.add(lock_key, 1, settings.SINGLE_FLIGHT_TIMEOUT)
+
+    try:
+        value = cache.get(tagged_key)
+        if value is None:
+            value = default() if callable(default) else default
+            cache.set(tagged_key, value, timeout)
+        return value
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+def bump_tag(tag: str) -> int | None:
+    """Advance the generation of a tag right away and return the new one.
+
+    None means the counter was missing and a fresh one was started.
+    """
+    key = TAG_VERSION_KEY.format(tag)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _new_version(), timeout=None)
+        return None
+
+
+def _bump(tags) -> None:
+    for tag in set(tags):
+        bump_tag(tag)
+
+
+def invalidate_tags(*tags) -> None:
+    """Bump the generation counter of every tag once the current transaction commits.
+
+    Entries stored under an older generation are never read again and simply expire.
+    """
+    if tags:
+        transaction.on_commit(lambda: _bump(tags))
+
+
+def get_post_cache_tags(cat_ids=(), tag_ids=(), post_ids=()) -> set[str]:
+    from .models import Category
+
+    tags = {POSTS_TAG}
+    tags.update(post_tag(pk) for pk in post_ids)
+    tags.update(tag_tag(pk) for pk in tag_ids)
+    cat_ids = {pk for pk in cat_ids if pk is not None}
+    if cat_ids:
+        categories = Category.objects.filter(pk__in=cat_ids)
+        ancestors = Category.objects.get_queryset_ancestors(categories, include_self=True)
+        tags.update(category_tag(pk) for pk in ancestors.values_list("pk", flat=True))
+    return tags
@@ -0,0 +1,90 @@
+"""Rendering of the comments of a post page.
+
+The post page only shows the first COMMENTS_PAGE_SIZE threads, the others are
+loaded page by page, and the replies of a thread are loaded when asked for,
+with one range query on the lft/rght columns of its root. Every fragment is
+rendered once per post, language and logged in state and kept under the
+comments tag of the post, which is bumped whenever a comment of the post
+changes. The rendered HTML leaves markers for what differs between requests:
+the relative times, and the edit links, which only the author of a comment sees.
+"""
+import datetime
+import re
+
+from django.conf import settings
+from django.http import Http404
+from django.template.defaultfilters import timesince
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+from . import cache
+from .models import Comment
+
+SINCE_RE = re.compile(r"<!--since:(\d+)-->")
+EDIT_RE = re.compile(r"<!--edit:(\d+):(\d+)-->")
+
+
+def get_cached(post, authenticated: bool, name: str, render):
+    return cache.get_or_set(f"comment_tree:{post.pk}:{get_language()}:{int(authenticated)}:{name}",
+                            render, tags=(cache.comments_tag(post.pk),))
+
+
+def fill_markers(html: str, post, user) -> str:
+    now = timezone.now()
+    html = SINCE_RE.sub(lambda match: timesince(datetime.datetime.fromtimestamp(int(match[1]), datetime.timezone.utc),
+                                                now), html)
+
+    def edit_link(match):
+        comment_id, author_id = match.groups()
+        if not user.is_authenticated or int(author_id) != user.pk:
+            return ""
+        return render_to_string("women/includes/comment_edit_link.html", {"post_id": post.pk, "comment_id": comment_id})
+
+    return mark_safe(EDIT_RE.sub(edit_link, html))
+
+
+def render_page(post, authenticated: bool, number: int) -> tuple[str, str | None]:
+    size = settings.COMMENTS_PAGE_SIZE
+    start = (number - 1) * size
+    threads = list(post.comments.filter(parent=None, active=True).select_related("author")
+                   .order_by("tree_id")[start:start + size + 1])
+    next_url = None
+    if len(threads) > size:
+        threads = threads[:size]
+        next_url = f"{reverse('comment_page', args=(post.slug,))}?page={number + 1}"
+    if not threads:
+        return "", None
+    html = render_to_string("women/post/comment_page.html",
+                            {"threads": threads, "post": post, "authenticated": authenticated})
+    return html, next_url
+
+
+def get_page(post, user, number: int = 1) -> tuple[str, str | None]:
+    """The threads of a page of comments and the url of the next page, None on the last one."""
+    html, next_url = get_cached(post, user.is_authenticated, f"page:{number}",
+                                lambda: render_page(post, user.is_authenticated, number))
+    return fill_markers(html, post, user), next_url
+
+
+def render_replies(post, authenticated: bool, comment_id: int) -> str:
+    root = post.comments.filter(pk=comment_id).values("tree_id", "lft", "rght").first()
+    if root is None:
+        raise Http404
+    replies = (Comment.objects.filter(tree_id=root["tree_id"], lft__gt=root["lft"], rght__lt=root["rght"])
+               .select_related("author", "parent__author").order_by("lft"))
+    return render_to_string("women/post/comment_tree.html", {"comments": replies, "authenticated": authenticated})
+
+
+def get_replies(post, user, comment_id: int) -> str:
+    """Every reply below a comment, as a tree."""
+    html = get_cached(post, user.is_authenticated, f"replies:{comment_id}",
+                      lambda: render_replies(post, user.is_authenticated, comment_id))
+    return fill_markers(html, post, user)
+
+
+def render_comments(post, user) -> str:
+    html, next_url = get_page(post, user)
+    return render_to_string("women/post/comment_threads.html", {"html": html, "next_url": next_url})
@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, PositiveBigIntegerField, When, Value
+
+from .models import Women
+from . import trending
+
+COUNTERS_KEY = "counters:{}"
+
+RECONCILE_COUNTERS = """
+    UPDATE women_women AS w
+    SET likes = s.likes, dislikes = s.dislikes, comments_count = s.comments_count, views_count = s.views_count
+    FROM (
+        SELECT p.id,
+               COALESCE(r.likes, 0) AS likes,
+               COALESCE(r.dislikes, 0) AS dislikes,
+               COALESCE(c.total, 0) AS comments_count,
+               COALESCE(v.total, 0) AS views_count
+        FROM women_women p
+        LEFT JOIN (SELECT post_id,
+                          COUNT(*) FILTER (WHERE value = 1) AS likes,
+                          COUNT(*) FILTER (WHERE value = -1) AS dislikes
+                   FROM women_rating GROUP BY post_id) r ON r.post_id = p.id
+        LEFT JOIN (SELECT post_id, COUNT(*) AS total
+                   FROM women_comment WHERE active AND parent_id IS NULL GROUP BY post_id) c ON c.post_id = p.id
+        LEFT JOIN (SELECT post_id, SUM(views) AS total
+                   FROM women_postviewdaily GROUP BY post_id) v ON v.post_id = p.id
+    ) AS s
+    WHERE w.id = s.id
+      AND (w.likes, w.dislikes, w.comments_count, w.views_count)
+          IS DISTINCT FROM (s.likes, s.dislikes, s.comments_count, s.views_count)
+    RETURNING w.id
+"""
+
+
+def forget(*post_ids) -> None:
+    keys = [COUNTERS_KEY.format(pk) for pk in post_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def increment(post_id, **deltas) -> None:
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        Women.objects.filter(pk=post_id).increment(**deltas)
+        trending.add_events({post_id: deltas})
+        forget(post_id)
+
+
+def add_views(views_by_post: dict[int, int]) -> None:
+    if views_by_post:
+        views = Case(*(When(pk=pk, then=Value(count)) for pk, count in views_by_post.items()),
+                     default=Value(0), output_field=PositiveBigIntegerField())
+        Women.objects.filter(pk__in=views_by_post).increment(views_count=views)
+        trending.add_events({pk: {"views_count": count} for pk, count in views_by_post.items()})
+        forget(*views_by_post)
+
+
+def remember_counters(cards) -> None:
+    cache.set_many({COUNTERS_KEY.format(card["id"]): {field: card[field] for field in Women.COUNTER_FIELDS}
+                    for card in cards}, settings.TAGGED_CACHE_TIMEOUT)
+
+
+def get_counters(post_ids) -> dict[int, dict[str, int]]:
+    """Current counters of the posts, from the cache where possible."""
+    keys = {COUNTERS_KEY.format(pk): pk for pk in post_ids}
+    counters = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    missing = [pk for pk in post_ids if pk not in counters]
+    if missing:
+        loaded = {row.pop("pk"): row for row in Women.objects.filter(pk__in=missing).values("pk", *Women.COUNTER_FIELDS)}
+        cache.set_many({COUNTERS_KEY.format(pk): row for pk, row in loaded.items()}, settings.TAGGED_CACHE_TIMEOUT)
+        counters.update(loaded)
+    return counters
+
+
+def apply_counters(cards) -> None:
+    """Replace the counters of post cards kept in a cached page with their current values."""
+    counters = get_counters([card["id"] for card in cards])
+    for card in cards:
+        card.update(counters.get(card["id"], {}))
+
+
+def reconcile() -> list[int]:
+    """Recompute every counter from the source tables and fix the posts that drifted, in one statement."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(RECONCILE_COUNTERS)
+        post_ids = [row[0] for row in cursor.fetchall()]
+        forget(*post_ids)
+    return post_ids
@@ -0,0 +1,133 @@
+"""Posts that the readers of a post also viewed.
+
+A nightly job reads the PageVisit rows of the last COVISIT_DAYS days, groups
+the posts seen by every visitor, and counts how many visitors saw every pair
+of posts. Pairs are kept as int64 keys (first * size + second) with counts in
+NumPy arrays, reduced every COVISIT_CHUNK_PAIRS pairs, so memory follows the
+number of distinct pairs rather than the number of visits. With shards > 1
+every pass only keeps the pairs whose first post falls in its shard, bounding
+memory further at the cost of reading the visits once per shard.
+
+Pairs are scored by count / sqrt(visitors of first * visitors of second) and
+the COVISIT_LIMIT best of every post are stored in RelatedPost.
+"""
+import datetime
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Women, PageVisit, RelatedPost
+
+
+class PairCounter:
+    def __init__(self, size: int, shards: int = 1, shard: int = 0, chunk_pairs: int | None = None):
+        self.size = size
+        self.shards = shards
+        self.shard = shard
+        self.chunk_pairs = chunk_pairs or settings.COVISIT_CHUNK_PAIRS
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.visitors = np.zeros(size, dtype=np.int64)
+        self.pending = defaultdict(list)
+        self.pending_pairs = 0
+
+    def add(self, posts: np.ndarray) -> None:
+        """Add the distinct posts seen by one visitor."""
+        if len(posts) > 1:
+            self.pending[len(posts)].append(posts)
+            self.pending_pairs += len(posts) * (len(posts) - 1)
+            if self.pending_pairs >= self.chunk_pairs:
+                self.reduce()
+        elif len(posts):
+            self.visitors[posts] += 1
+
+    def reduce(self) -> None:
+        new_keys = []
+        # Visitors with the same number of posts are expanded into pairs together.
+        for length, sessions in self.pending.items():
+            matrix = np.array(sessions, dtype=np.int64)
+            np.add.at(self.visitors, matrix.ravel(), 1)
+            off_diagonal = ~np.eye(length, dtype=bool)
+            first = np.broadcast_to(matrix[:, :, None], (len(matrix), length, length))[:, off_diagonal].ravel()
+            second = np.broadcast_to(matrix[:, None, :], (len(matrix), length, length))[:, off_diagonal].ravel()
+            if self.shards > 1:
+                keep = first % self.shards == self.shard
+                first, second = first[keep], second[keep]
+            new_keys.append(first * self.size + second)
+        self.pending.clear()
+        self.pending_pairs = 0
+        new_keys = np.concatenate(new_keys or [np.empty(0, dtype=np.int64)])
+        if not len(new_keys):
+            return
+        keys, counts = np.unique(new_keys, return_counts=True)
+        keys = np.concatenate([self.keys, keys])
+        counts = np.concatenate([self.counts, counts])
+        order = np.argsort(keys, kind="stable")
+        keys, counts = keys[order], counts[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        self.keys, self.counts = keys[starts], np.add.reduceat(counts, starts)
+
+    def top(self, limit: int, min_count: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """The limit best (post, related post, score) of every post, best first."""
+        self.reduce()
+        keep = self.counts >= min_count
+        first, second = np.divmod(self.keys[keep], self.size)
+        scores = self.counts[keep] / np.sqrt(self.visitors[first] * self.visitors[second])
+        order = np.lexsort((-scores, first))
+        first, second, scores = first[order], second[order], scores[order]
+        starts = np.flatnonzero(np.r_[True, first[1:] != first[:-1]]) if len(first) else np.empty(0, dtype=np.int64)
+        ranks = np.arange(len(first)) - np.repeat(starts, np.diff(np.r_[starts, len(first)]))
+        keep = ranks < limit
+        return first[keep], second[keep], scores[keep]
+
+
+def iter_visitor_posts(since: datetime.datetime, post_ids: dict[str, int]):
+    """Yield the distinct posts seen by every visitor since the given time, most recent first,
+    with the number of visits read for them."""
+    visits = (PageVisit.objects.filter(visit_time__gte=since).exclude(session_id="")
+              .order_by("session_id", "-visit_time").values_list("session_id", "url"))
+    current, posts, read = None, {}, 0
+    for session_id, url in visits.iterator(chunk_size=20_000):
+        if session_id != current:
+            if read:
+                yield np.fromiter(posts, dtype=np.int64, count=len(posts)), read
+            current, posts, read = session_id, {}, 0
+        read += 1
+        post_id = post_ids.get(url)
+        if post_id is not None and len(posts) < settings.COVISIT_MAX_VISITOR_POSTS:
+            posts[post_id] = None
+    if read:
+        yield np.fromiter(posts, dtype=np.int64, count=len(posts)), read
+
+
+def build(days: int | None = None, shards: int | None = None) -> dict:
+    """Recompute the posts also viewed by the readers of every post and return statistics of the run."""
+    started = time.perf_counter()
+    since = timezone.now() - datetime.timedelta(days=days or settings.COVISIT_DAYS)
+    shards = shards or settings.COVISIT_SHARDS
+    post_ids = dict(Women.published.values_list("slug", "pk"))
+    size = max(post_ids.values(), default=0) + 1
+
+    rows, visits, visitors, pairs = [], 0, 0, 0
+    for shard in range(shards):
+        counter = PairCounter(size, shards, shard)
+        for posts, read in iter_visitor_posts(since, post_ids):
+            counter.add(posts)
+            visits += read
+            visitors += 1
+        best = counter.top(settings.COVISIT_LIMIT, settings.COVISIT_MIN_COUNT)
+        pairs += len(counter.keys)
+        rows.extend(RelatedPost(post_id=int(first), related_id=int(second), score=float(score),
+                                source=RelatedPost.Source.VISITS)
+                    for first, second, score in zip(*best))
+
+    with transaction.atomic():
+        RelatedPost.objects.filter(source=RelatedPost.Source.VISITS).delete()
+        RelatedPost.objects.bulk_create(rows, batch_size=1000)
+    seconds = time.perf_counter() - started
+    return {"visits": visits // shards, "visitors": visitors // shards, "pairs": pairs, "stored": len(rows),
+            "seconds": seconds, "visits_per_second": visits / seconds if seconds else 0.0}
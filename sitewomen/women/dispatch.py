@@ -0,0 +1,43 @@
+"""Translation jobs, queued once the transaction commits and coalesced.
+
+Every request to translate a field of an object bumps the version of
+(model, pk, field) in the cache when the transaction commits, and queues a job
+carrying that version TRANSLATION_DEBOUNCE seconds later. The worker drops a
+job whose version is no longer the latest, so a burst of edits ends in one
+translation, of the last edit. Versions are kept TRANSLATION_VERSION_TIMEOUT
+seconds, far longer than a job waits.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def get_key(model_name: str, field_name: str, pk: int) -> str:
+    return f"translation_version:{model_name}:{pk}:{field_name}"
+
+
+def bump(key: str) -> int:
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, settings.TRANSLATION_VERSION_TIMEOUT):
+            return 1
+        return cache.incr(key)
+
+
+def schedule_translation(model_name: str, field_name: str, pk: int) -> None:
+    from .tasks import translate_model_content as task
+
+    def dispatch():
+        version = bump(get_key(model_name, field_name, pk))
+        task.apply_async((model_name, field_name, pk, version), countdown=settings.TRANSLATION_DEBOUNCE)
+
+    transaction.on_commit(dispatch)
+
+
+def is_latest(model_name: str, field_name: str, pk: int, version: int | None) -> bool:
+    """False once a newer job was queued. Jobs without a version and lost versions count as the latest."""
+    if version is None:
+        return True
+    latest = cache.get(get_key(model_name, field_name, pk))
+    return latest is None or latest == version
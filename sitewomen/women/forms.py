@@ -53,4 +53,5 @@ class CommentForm(forms.ModelForm):
 
 class SearchForm(forms.Form):
     query = forms.CharField(label=_("Enter search query"),
-                    widget=forms.TextInput(attrs={"class": "form-control me-2", "placeholder": _("Search...")}))
\ No newline at end of file
+                    widget=forms.TextInput(attrs={"class": "form-control me-2", "placeholder": _("Search..."),
+                                                 "list": "search-suggestions", "autocomplete": "off"}))
\ No newline at end of file
@@ -0,0 +1,55 @@
+"""HyperLogLog sketches of distinct values, stored as bytes.
+
+A sketch is 2 ** HLL_PRECISION one-byte registers, whatever the number of
+values added, with a standard error of about 1.04 / sqrt(2 ** HLL_PRECISION).
+Adding a value twice changes nothing and the union of two sketches is their
+register-wise maximum, so sketches of days merge into weeks and months.
+"""
+import hashlib
+import math
+
+import numpy as np
+from django.conf import settings
+
+
+def empty(precision: int | None = None) -> bytes:
+    return bytes(2 ** (precision or settings.HLL_PRECISION))
+
+
+def get_hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def add(sketch: bytes, values) -> bytes:
+    registers = bytearray(sketch)
+    precision = len(registers).bit_length() - 1
+    bits = 64 - precision
+    for value in values:
+        hashed = get_hash(value)
+        index, rest = hashed >> bits, hashed & ((1 << bits) - 1)
+        # Position of the first 1 bit in the remaining bits.
+        rank = bits - rest.bit_length() + 1
+        if rank > registers[index]:
+            registers[index] = rank
+    return bytes(registers)
+
+
+def merge(*sketches: bytes) -> bytes:
+    sketches = [sketch for sketch in sketches if sketch]
+    if not sketches:
+        return empty()
+    return np.maximum.reduce([np.frombuffer(sketch, dtype=np.uint8) for sketch in sketches]).tobytes()
+
+
+def count(sketch: bytes) -> int:
+    if not sketch:
+        return 0
+    registers = np.frombuffer(sketch, dtype=np.uint8)
+    size = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / size)
+    estimate = alpha * size * size / np.sum(np.ldexp(1.0, -registers.astype(np.int32)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * size and zeros:
+        # Linear counting is more accurate for small cardinalities.
+        estimate = size * math.log(size / zeros)
+    return round(estimate)
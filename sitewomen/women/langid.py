@@ -0,0 +1,31 @@
+"""Language of texts, detected with the fastText lid.176 model.
+
+The model takes about 126 MB and seconds to load, so it is loaded once per
+process. Celery workers load it in the main process before the pool forks
+(see women.tasks), and the children share its pages copy-on-write as long as
+they only read them; a process that forks without it loads it on first use.
+"""
+import fasttext
+from django.conf import settings
+
+_model = None
+
+
+def get_model():
+    global _model
+    if _model is None:
+        _model = fasttext.load_model(str(settings.FASTTEXT_MODEL_PATH))
+    return _model
+
+
+def detect_languages(texts: list[str]) -> list[str]:
+    """Language codes of the texts, with one prediction call for all of them."""
+    if not texts:
+        return []
+    # fastText predicts one line per text.
+    labels, _ = get_model().predict([" ".join(text.split()) for text in texts], k=1)
+    return [label[0].replace("__label__", "") for label in labels]
+
+
+def detect_language(text: str) -> str:
+    return detect_languages([text])[0]
@@ -0,0 +1,60 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from women.models import Women, PageVisit, PostViewDaily
+
+
+class Command(BaseCommand):
+    help = "Aggregate existing PageVisit rows into PostViewDaily, one day at a time"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", type=datetime.date.fromisoformat,
+                            help="First day to aggregate (default: the day of the oldest visit)")
+        parser.add_argument("--end", type=datetime.date.fromisoformat,
+                            help="Last day to aggregate (default: yesterday)")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = options["start"]
+        if start is None:
+            first_visit = PageVisit.objects.aggregate(first=Min("visit_time"))["first"]
+            if first_visit is None:
+                self.stdout.write("There are no page visits to aggregate")
+                return
+            start = timezone.localtime(first_visit).date()
+        end = options["end"] or timezone.localdate() - datetime.timedelta(days=1)
+
+        day = start
+        while day <= end:
+            self.stdout.write(f"{day}: {self.backfill_day(day, options['batch_size'])} posts")
+            day += datetime.timedelta(days=1)
+
+    @staticmethod
+    def backfill_day(day, batch_size):
+        begin = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+        visits = (PageVisit.objects.filter(visit_time__gte=begin, visit_time__lt=begin + datetime.timedelta(days=1))
+                  .values("url").annotate(views=Count("id")).order_by())
+        views_by_url = {row["url"]: row["views"] for row in visits}
+        post_ids = dict(Women.objects.filter(slug__in=views_by_url).values_list("slug", "pk"))
+        views_by_post = {post_ids[url]: views for url, views in views_by_url.items() if url in post_ids}
+
+        with transaction.atomic():
+            rows = {row.post_id: row for row in
+                    PostViewDaily.objects.select_for_update().filter(date=day, post_id__in=views_by_post)}
+            created, updated = [], []
+            for post_id, views in views_by_post.items():
+                row = rows.get(post_id)
+                if row is None:
+                    created.append(PostViewDaily(post_id=post_id, date=day, views=views))
+                # Totals are only raised, so running the command again, or over days whose
+                # raw visits were not kept, never loses views counted by the flush.
+                elif row.views < views:
+                    row.views = views
+                    updated.append(row)
+            PostViewDaily.objects.bulk_create(created, batch_size=batch_size)
+            PostViewDaily.objects.bulk_update(updated, ["views"], batch_size=batch_size)
+        return len(views_by_post)
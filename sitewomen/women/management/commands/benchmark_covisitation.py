@@ -0,0 +1,43 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from women.covisitation import PairCounter
+
+
+class Command(BaseCommand):
+    help = "Measure co-visitation counting on synthetic visits, without the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--visits", type=int, default=20_000_000)
+        parser.add_argument("--posts", type=int, default=100_000)
+        parser.add_argument("--shards", type=int, default=1)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        posts = options["posts"]
+        # Most visitors read one or two posts, a few read many; popular posts get most of the views.
+        lengths = np.minimum(rng.geometric(0.4, size=options["visits"]), settings.COVISIT_MAX_VISITOR_POSTS)
+        lengths = lengths[:np.searchsorted(np.cumsum(lengths), options["visits"]) + 1]
+        views = np.minimum(rng.zipf(1.3, size=int(lengths.sum())), posts) - 1
+        bounds = np.r_[0, np.cumsum(lengths)]
+
+        started = time.perf_counter()
+        stored = pairs = peak = 0
+        for shard in range(options["shards"]):
+            counter = PairCounter(posts, options["shards"], shard)
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                counter.add(np.unique(views[start:end]))
+            first, _, _ = counter.top(settings.COVISIT_LIMIT, settings.COVISIT_MIN_COUNT)
+            pairs += len(counter.keys)
+            peak = max(peak, counter.keys.nbytes + counter.counts.nbytes)
+            stored += len(first)
+        seconds = time.perf_counter() - started
+
+        self.stdout.write(f"{len(views)} visits of {len(lengths)} visitors in {seconds:.1f}s "
+                          f"({len(views) * options['shards'] / seconds:.0f} visits/s)")
+        self.stdout.write(f"{pairs} distinct pairs, {stored} stored, "
+                          f"largest pair arrays {peak / 2 ** 20:.0f} MiB per shard")
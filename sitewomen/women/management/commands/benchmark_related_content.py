@@ -0,0 +1,72 @@
+import itertools
+import random
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from women.related_content import ContentMatrix, get_term_counts, get_vectors
+
+ALPHABET = "абвгдеёжзийклмнопрстуфхцчшщыэюя"
+
+
+class Command(BaseCommand):
+    help = "Measure vectorising and neighbour search on a synthetic content matrix, without the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=100_000)
+        parser.add_argument("--words", type=int, default=300, help="Average number of words in a post")
+        parser.add_argument("--queries", type=int, default=200, help="Number of single-post updates to time")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options["seed"])
+        vocabulary = ["".join(rnd.choices(ALPHABET, k=rnd.randint(3, 10))) for _ in range(50_000)]
+        # Word frequencies in text roughly follow Zipf's law.
+        cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+
+        with tempfile.TemporaryDirectory() as directory:
+            matrix = ContentMatrix("bench", directory)
+            posts = options["posts"]
+            batch_size = settings.RELATED_CONTENT_BATCH_SIZE
+
+            start = time.perf_counter()
+            matrix.idf = np.ones(matrix.dimensions, dtype=np.float32)
+            matrix.allocate(posts)
+            for first in range(0, posts, batch_size):
+                texts = [" ".join(rnd.choices(vocabulary, cum_weights=cum_weights, k=rnd.randint(options["words"] // 2,
+                                                                                 options["words"] * 3 // 2)))
+                         for _ in range(min(batch_size, posts - first))]
+                matrix.vectors[first:first + len(texts)] = get_vectors(
+                    [get_term_counts(text, matrix.dimensions) for text in texts], matrix.idf)
+            matrix.ids[:] = np.arange(1, posts + 1)
+            matrix.vectors.flush()
+            build_time = time.perf_counter() - start
+            size = (matrix.vectors.nbytes + matrix.ids.nbytes + matrix.kth.nbytes) / 2 ** 20
+            self.stdout.write(f"{posts} posts vectorised in {build_time:.1f}s, {size:.0f} MiB on disk")
+
+            start = time.perf_counter()
+            sample = np.arange(min(posts, batch_size * 4))
+            for _ in matrix.get_neighbours(sample):
+                pass
+            per_post = (time.perf_counter() - start) / len(sample)
+            self.stdout.write(f"Neighbours of {len(sample)} posts in batches of {batch_size}: "
+                              f"{per_post * 1000:.2f}ms per post, full rebuild ≈ {per_post * posts / 60:.1f}min")
+
+            timings = []
+            for _ in range(options["queries"]):
+                slot = rnd.randrange(posts)
+                start = time.perf_counter()
+                # What an update does besides the database: compare the changed row with every row.
+                best = np.asarray(matrix.vectors) @ np.asarray(matrix.vectors[[slot]]).T
+                np.flatnonzero(best[:, 0] > np.asarray(matrix.kth))
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+
+            def percentile(p):
+                return timings[min(len(timings) - 1, len(timings) * p // 100)] * 1000
+
+            self.stdout.write(f"{len(timings)} single-post comparisons: p50 {percentile(50):.1f}ms, "
+                              f"p99 {percentile(99):.1f}ms")
@@ -0,0 +1,45 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from women.search import normalize_query
+from women.suggest import PrefixIndex
+
+ALPHABET = "абвгдеёжзийклмнопрстуфхцчшщыэюя"
+
+
+class Command(BaseCommand):
+    help = "Measure the latency of suggestion lookups on a synthetic prefix index"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--titles", type=int, default=100_000)
+        parser.add_argument("--queries", type=int, default=20_000)
+        parser.add_argument("--limit", type=int, default=settings.SUGGEST_LIMIT)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options["seed"])
+        words = ["".join(rnd.choices(ALPHABET, k=rnd.randint(3, 10))).capitalize() for _ in range(20_000)]
+        titles = [" ".join(rnd.choices(words, k=rnd.randint(2, 5))) for _ in range(options["titles"])]
+
+        start = time.perf_counter()
+        index = PrefixIndex((pk, title, f"post-{pk}") for pk, title in enumerate(titles))
+        build_time = time.perf_counter() - start
+
+        timings = []
+        for _ in range(options["queries"]):
+            word = rnd.choice(words)
+            query = word[:rnd.randint(1, len(word))]
+            start = time.perf_counter_ns()
+            index.search(normalize_query(query), options["limit"])
+            timings.append(time.perf_counter_ns() - start)
+        timings.sort()
+
+        def percentile(p):
+            return timings[min(len(timings) - 1, len(timings) * p // 100)] / 1000
+
+        self.stdout.write(f"Index of {len(index)} titles ({len(index.terms)} terms) built in {build_time:.2f}s")
+        self.stdout.write(f"{len(timings)} lookups: p50 {percentile(50):.1f}µs, p95 {percentile(95):.1f}µs, "
+                          f"p99 {percentile(99):.1f}µs, max {timings[-1] / 1000:.1f}µs")
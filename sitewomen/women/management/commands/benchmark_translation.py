@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from women import translators
+
+
+class Command(BaseCommand):
+    help = "Measure the translation fan-out of a text against the offline backend, without the network"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--texts", type=int, default=20)
+        parser.add_argument("--delay", type=float, default=0.2, help="Seconds per request to the backend")
+
+    def handle(self, *args, **options):
+        translator = translators.OfflineTranslator(delay=options["delay"])
+        started = time.perf_counter()
+        for number in range(options["texts"]):
+            translators.translate(f"Текст {number}", "ru", translator)
+        seconds = time.perf_counter() - started
+
+        languages = len(settings.MODELTRANSLATION_LANGUAGES) - 1
+        self.stdout.write(f"{options['texts']} texts, {len(translator.calls)} requests in {seconds:.2f}s "
+                          f"({seconds / options['texts'] * 1000:.0f} ms per text, "
+                          f"{options['delay'] * languages * 1000:.0f} ms one request at a time)")
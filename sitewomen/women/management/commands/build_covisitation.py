@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from women import covisitation
+
+
+class Command(BaseCommand):
+    help = "Recompute the posts also viewed by the readers of every post from the stored visits"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Number of days of visits to read (default: COVISIT_DAYS)")
+        parser.add_argument("--shards", type=int, help="Passes over the visits (default: COVISIT_SHARDS)")
+
+    def handle(self, *args, **options):
+        stats = covisitation.build(options["days"], options["shards"])
+        self.stdout.write(f"{stats['visits']} visits of {stats['visitors']} visitors, {stats['pairs']} pairs, "
+                          f"{stats['stored']} stored in {stats['seconds']:.1f}s "
+                          f"({stats['visits_per_second']:.0f} visits/s)")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from women.models import Women, RelatedPost
+from women.related import update_related_posts
+from women import related_content
+
+
+class Command(BaseCommand):
+    help = "Recompute the similar posts of every post"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--tags-only", action="store_true", help="Keep the content vectors as they are")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        post_ids = list(Women.objects.order_by("pk").values_list("pk", flat=True))
+        RelatedPost.objects.exclude(post_id__in=post_ids).delete()
+        stored = 0
+        for start in range(0, len(post_ids), batch_size):
+            stored += update_related_posts(post_ids[start:start + batch_size])
+        self.stdout.write(f"{len(post_ids)} posts, {stored} similar posts by tags stored")
+        if not options["tags_only"]:
+            self.stdout.write(f"{related_content.rebuild()} similar posts by content stored")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from women.models import TranslationMemory
+from women.translation_memory import get_stats
+
+
+class Command(BaseCommand):
+    help = "Show the hits and misses of the translation memory since the cache was last cleared"
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        self.stdout.write(f"{stats['cache_hits']} cache hits, {stats['database_hits']} database hits, "
+                          f"{stats['misses']} misses, hit ratio {stats['hit_ratio']:.1%}")
+        self.stdout.write(f"{TranslationMemory.objects.count()} translations stored")
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.1 on 2026-10-18 15:48
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+FILL_SEARCH_VECTORS = """
+    UPDATE women_women SET
+        search_vector_en = setweight(to_tsvector('english', COALESCE(title, '')), 'A') ||
+                           setweight(to_tsvector('english', COALESCE(content_en, '')), 'B'),
+        search_vector_ru = setweight(to_tsvector('russian', COALESCE(title, '')), 'A') ||
+                           setweight(to_tsvector('russian', COALESCE(content_ru, '')), 'B'),
+        search_vector_be = setweight(to_tsvector('simple', COALESCE(title, '')), 'A') ||
+                           setweight(to_tsvector('simple', COALESCE(content_be, '')), 'B');
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('women', '0019_comment_is_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='women',
+            name='search_vector_be',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='women',
+            name='search_vector_en',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='women',
+            name='search_vector_ru',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='women',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector_en'], name='women_search_en_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='women',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector_ru'], name='women_search_ru_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='women',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector_be'], name='women_search_be_idx'),
+        ),
+        migrations.RunSQL(FILL_SEARCH_VECTORS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.1 on 2026-10-18 16:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('women', '0021_pagevisit_flush'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostViewDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pagevisit',
+            index=models.Index(fields=['visit_time'], name='women_pagev_visit_t_b84f49_idx'),
+        ),
+        migrations.AddField(
+            model_name='postviewdaily',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_views', to='women.women'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='postviewdaily',
+            unique_together={('post', 'date')},
+        ),
+    ]
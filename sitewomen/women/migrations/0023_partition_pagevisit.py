@@ -0,0 +1,76 @@
+import datetime
+
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+CREATE_PARTITIONED_TABLE = [
+    "ALTER TABLE women_pagevisit RENAME TO women_pagevisit_old",
+    "ALTER INDEX women_pagevisit_pkey RENAME TO women_pagevisit_old_pkey",
+    "ALTER INDEX women_pagev_visit_t_b84f49_idx RENAME TO women_pagevisit_old_visit_time_idx",
+    "ALTER TABLE women_pagevisit_old ALTER COLUMN id DROP IDENTITY",
+    "CREATE SEQUENCE women_pagevisit_id_seq",
+    """
+    CREATE TABLE women_pagevisit (
+        id bigint NOT NULL DEFAULT nextval('women_pagevisit_id_seq'),
+        url varchar(500) NOT NULL,
+        visit_time timestamp with time zone NOT NULL,
+        PRIMARY KEY (id, visit_time)
+    ) PARTITION BY RANGE (visit_time)
+    """,
+    "ALTER SEQUENCE women_pagevisit_id_seq OWNED BY women_pagevisit.id",
+    "CREATE INDEX women_pagev_visit_t_b84f49_idx ON women_pagevisit (visit_time)",
+    "SELECT setval('women_pagevisit_id_seq', COALESCE(MAX(id), 0) + 1, false) FROM women_pagevisit_old",
+]
+
+# Only the visits within the new daily partitions are moved. The old table, with the visits before them,
+# becomes the default partition, where apply_retention deletes them in chunks.
+MOVE_RECENT_ROWS = """
+    WITH moved AS (
+        DELETE FROM women_pagevisit_old WHERE visit_time >= %(start)s AND visit_time < %(end)s
+        RETURNING id, url, visit_time
+    )
+    INSERT INTO women_pagevisit (id, url, visit_time) SELECT id, url, visit_time FROM moved
+"""
+
+ATTACH_OLD_TABLE = [
+    "ALTER TABLE women_pagevisit_old DROP CONSTRAINT women_pagevisit_old_pkey",
+    "ALTER TABLE women_pagevisit_old RENAME TO women_pagevisit_default",
+    "ALTER TABLE women_pagevisit ATTACH PARTITION women_pagevisit_default DEFAULT",
+]
+
+
+def create_day_partition(schema_editor, day):
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    end = timezone.make_aware(datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time.min))
+    schema_editor.execute(f"CREATE TABLE women_pagevisit_p{day:%Y%m%d} PARTITION OF women_pagevisit "
+                          f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')")
+
+
+def partition_page_visits(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for statement in CREATE_PARTITIONED_TABLE:
+        schema_editor.execute(statement)
+    today = timezone.localdate()
+    first_day = day = today - datetime.timedelta(days=settings.PAGEVIEW_RETENTION_DAYS)
+    while day <= today + datetime.timedelta(days=settings.PAGEVIEW_PARTITIONS_AHEAD):
+        create_day_partition(schema_editor, day)
+        day += datetime.timedelta(days=1)
+    schema_editor.execute(MOVE_RECENT_ROWS, {
+        "start": timezone.make_aware(datetime.datetime.combine(first_day, datetime.time.min)),
+        "end": timezone.make_aware(datetime.datetime.combine(day, datetime.time.min)),
+    })
+    for statement in ATTACH_OLD_TABLE:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('women', '0022_post_view_daily'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_page_visits, migrations.RunPython.noop),
+    ]
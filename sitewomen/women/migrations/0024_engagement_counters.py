@@ -0,0 +1,43 @@
+# Generated by Django 4.2.1 on 2026-10-18 16:13
+
+from django.db import migrations, models
+
+
+FILL_COUNTERS = """
+    UPDATE women_women AS w SET
+        likes = (SELECT COUNT(*) FROM women_rating r WHERE r.post_id = w.id AND r.value = 1),
+        dislikes = (SELECT COUNT(*) FROM women_rating r WHERE r.post_id = w.id AND r.value = -1),
+        comments_count = (SELECT COUNT(*) FROM women_comment c
+                          WHERE c.post_id = w.id AND c.active AND c.parent_id IS NULL),
+        views_count = (SELECT COALESCE(SUM(v.views), 0) FROM women_postviewdaily v WHERE v.post_id = w.id);
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('women', '0023_partition_pagevisit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='women',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='women',
+            name='dislikes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='women',
+            name='likes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='women',
+            name='views_count',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(FILL_COUNTERS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.1 on 2026-10-18 16:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('women', '0025_related_post'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='relatedpost',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='relatedpost',
+            name='language',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='relatedpost',
+            name='source',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Tags'), (1, 'Content')], default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name='relatedpost',
+            unique_together={('post', 'related', 'source', 'language')},
+        ),
+    ]
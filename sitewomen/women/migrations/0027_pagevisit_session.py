@@ -0,0 +1,23 @@
+# Generated by Django 4.2.1 on 2026-10-18 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('women', '0026_related_post_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pagevisit',
+            name='session_id',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='relatedpost',
+            name='source',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Tags'), (1, 'Content'), (2, 'Visits')], default=0),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.1 on 2026-10-18 16:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('women', '0028_trending_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostVisitors',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('week', 'Week'), ('month', 'Month')], max_length=5)),
+                ('start', models.DateField()),
+                ('sketch', models.BinaryField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visitors', to='women.women')),
+            ],
+            options={
+                'unique_together': {('post', 'period', 'start')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('women', '0030_translationmemory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pagevisitflush',
+            name='epoch',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,10 +1,16 @@
+import datetime
+
 from unidecode import unidecode
 
+from django.conf import settings
 from django.core.validators import MinLengthValidator
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
 from django.template.defaultfilters import slugify
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from ckeditor.fields import RichTextField
 from imagekit.models import ImageSpecField
@@ -16,7 +22,43 @@ from .validators import RussianValidator
 from services.utils import unique_slugify
 
 
-class PublishedManager(models.Manager):
+class WomenQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        from .cache import get_post_cache_tags, invalidate_tags
+        from .related import schedule_update
+        from .suggest import SUGGEST_FIELDS, suggest_index
+
+        rows = list(self.values_list("pk", "cat_id"))
+        count = super().update(**kwargs)
+        if rows:
+            post_ids = [pk for pk, _ in rows]
+            tag_ids = set(Women.tags.through.objects.filter(women_id__in=post_ids).values_list("tagpost_id", flat=True))
+            tags = get_post_cache_tags(cat_ids={cat_id for _, cat_id in rows}, tag_ids=tag_ids, post_ids=post_ids)
+            if SUGGEST_FIELDS.intersection(kwargs):
+                posts = Women.objects.filter(pk__in=post_ids).values_list("pk", "title", "slug", "is_published")
+                suggest_index.posts_changed((pk, title if is_published == Women.Status.PUBLISHED else None, slug)
+                                            for pk, title, slug, is_published in posts)
+            invalidate_tags(*tags)
+            if "is_published" in kwargs:
+                schedule_update(post_ids=post_ids, content=True)
+        return count
+
+    def increment(self, **deltas):
+        # Counters are derived data, so changing them must not invalidate the listing caches.
+        return models.QuerySet.update(self, **{field: models.F(field) + delta
+                                               for field, delta in deltas.items()})
+
+    def update_search_vectors(self):
+        vectors = {
+            f"search_vector_{language}": SearchVector("title", weight="A", config=config) +
+                                         SearchVector(f"content_{language}", weight="B", config=config)
+            for language, config in settings.SEARCH_CONFIGS.items()
+        }
+        # The vectors are derived data, so writing them must not invalidate the listing caches.
+        return models.QuerySet.update(self, **vectors)
+
+
+class PublishedManager(models.Manager.from_queryset(WomenQuerySet)):
     def get_queryset(self):
         return super().get_queryset().filter(is_published=Women.Status.PUBLISHED)
 
@@ -53,8 +95,17 @@ class Women(models.Model):
                                    related_name="woman", verbose_name=_("Husband"))
     author = models.ForeignKey(get_user_model(), on_delete=models.SET_NULL, related_name="posts", null=True,
                                verbose_name=_("Author"))
+    search_vector_en = SearchVectorField(null=True, editable=False)
+    search_vector_ru = SearchVectorField(null=True, editable=False)
+    search_vector_be = SearchVectorField(null=True, editable=False)
+    likes = models.PositiveIntegerField(default=0, editable=False)
+    dislikes = models.PositiveIntegerField(default=0, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    views_count = models.PositiveBigIntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = ("likes", "dislikes", "comments_count", "views_count")
 
-    objects = models.Manager()
+    objects = WomenQuerySet.as_manager()
     published = PublishedManager()
 
     def __str__(self):
@@ -67,7 +118,10 @@ class Women(models.Model):
         get_latest_by = ["time_create"]
         indexes = [
             models.Index(fields=["-time_create"]),
-            models.Index(fields=["is_published"], name='is_published_idx')
+            models.Index(fields=["is_published"], name='is_published_idx'),
+            GinIndex(fields=["search_vector_en"], name="women_search_en_idx"),
+            GinIndex(fields=["search_vector_ru"], name="women_search_ru_idx"),
+            GinIndex(fields=["search_vector_be"], name="women_search_be_idx"),
         ]
 
     def get_absolute_url(self):
@@ -77,8 +131,14 @@ class Women(models.Model):
         self.slug = unique_slugify(self, slugify(unidecode(self.title)))
         super().save(*args, **kwargs)
 
+    def get_edit_fields(self) -> list[str]:
+        """Every column but the counters, which only change through F() updates: saving a post
+        edited in a form with update_fields=get_edit_fields() keeps the votes and views counted meanwhile."""
+        return [field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS]
+
     def get_sum_rating(self):
-        return sum([rating.value for rating in self.ratings.all()])
+        return self.likes - self.dislikes
 
 
 class Category(MPTTModel):
@@ -199,4 +259,92 @@ class Rating(models.Model):
 
 class PageVisit(models.Model):
     url = models.CharField(max_length=500)
-    visit_time = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    visit_time = models.DateTimeField(default=timezone.now)
+    # Anonymous visitor id from the visitor cookie, not tied to an account.
+    session_id = models.CharField(max_length=32, blank=True, default="")
+
+    class Meta:
+        indexes = [models.Index(fields=['visit_time'])]
+
+
+class PageVisitFlush(models.Model):
+    """How many of the views of a page on a given day counted in the cache are already added to PostViewDaily,
+    and the epoch of the counter they were read from, see women.pageviews.flush_views."""
+    url = models.CharField(max_length=500)
+    date = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    epoch = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('url', 'date')
+
+class PostViewDaily(models.Model):
+    post = models.ForeignKey(Women, on_delete=models.CASCADE, related_name="daily_views")
+    date = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('post', 'date')
+
+
+class RelatedPost(models.Model):
+    class Source(models.IntegerChoices):
+        TAGS = 0, _("Tags")
+        CONTENT = 1, _("Content")
+        VISITS = 2, _("Visits")
+
+    post = models.ForeignKey(Women, on_delete=models.CASCADE, related_name="related_links")
+    related = models.ForeignKey(Women, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    source = models.PositiveSmallIntegerField(choices=Source.choices, default=Source.TAGS)
+    # Content neighbours are found separately in every language; empty for tags.
+    language = models.CharField(max_length=10, blank=True)
+
+    class Meta:
+        unique_together = ('post', 'related', 'source', 'language')
+        ordering = ['-score', '-related_id']
+
+
+class TrendingScore(models.Model):
+    """Log of the forward-decayed sum of a post's weighted events, see women.trending."""
+    post = models.OneToOneField(Women, on_delete=models.CASCADE, primary_key=True, related_name="trending")
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [models.Index(fields=['-score'])]
+
+
+class PostVisitors(models.Model):
+    """HyperLogLog sketch of the visitors of a post over a day, a week or a month, see women.hll."""
+    class Period(models.TextChoices):
+        DAY = "day", _("Day")
+        WEEK = "week", _("Week")
+        MONTH = "month", _("Month")
+
+    post = models.ForeignKey(Women, on_delete=models.CASCADE, related_name="visitors")
+    period = models.CharField(max_length=5, choices=Period.choices)
+    start = models.DateField()
+    sketch = models.BinaryField()
+
+    class Meta:
+        unique_together = ('post', 'period', 'start')
+
+    @staticmethod
+    def get_start(period: str, date: datetime.date) -> datetime.date:
+        if period == PostVisitors.Period.WEEK:
+            return date - datetime.timedelta(days=date.weekday())
+        if period == PostVisitors.Period.MONTH:
+            return date.replace(day=1)
+        return date
+
+
+class TranslationMemory(models.Model):
+    """A machine translation kept for the next time the same text is translated, see women.translation_memory."""
+    source_language = models.CharField(max_length=10)
+    target_language = models.CharField(max_length=10)
+    text_hash = models.CharField(max_length=64)
+    translation = models.TextField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('source_language', 'target_language', 'text_hash')
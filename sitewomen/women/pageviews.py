@@ -0,0 +1,244 @@
+import datetime
+import json
+import logging
+import random
+import re
+import uuid
+from collections import defaultdict
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .counters import add_views
+from .models import Women, PageVisit, PageVisitFlush, PostViewDaily, PostVisitors
+from . import hll
+
+COUNTER_KEY = "pageviews:{date}:{url}"
+SLOTS_KEY = "pageviews:{date}:slots"
+SLOT_KEY = "pageviews:{date}:slot:{number}"
+VISITS_KEY = "pageviews:{date}:visits:{slot}"
+FLUSHING_KEY = "pageviews:{date}:visits:{slot}:flushing"
+VISITOR_ID_RE = re.compile(r"[0-9a-f]{32}")
+# A view counter holds the views in its low bits and a random epoch above them, see _incr_views.
+EPOCH_BITS = 32
+
+# Sets the visits of a slot aside for the flush, unless the previous flush died before removing its own.
+TAKE_VISITS = """
+    if redis.call("EXISTS", KEYS[2]) == 0 and redis.call("EXISTS", KEYS[1]) == 1 then
+        redis.call("RENAME", KEYS[1], KEYS[2])
+    end
+    return redis.call("LRANGE", KEYS[2], 0, -1)
+"""
+
+logger = logging.getLogger(__name__)
+
+_redis = None
+
+
+def get_redis() -> redis.Redis:
+    """The Redis database buffering the visits, which the cache cannot do without a key per visit."""
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(settings.PAGEVIEW_REDIS_URL)
+    return _redis
+
+
+def is_bot(request) -> bool:
+    user_agent = request.META.get("HTTP_USER_AGENT", "")
+    return not user_agent or re.search(settings.PAGEVIEW_IGNORED_USER_AGENTS, user_agent, re.IGNORECASE) is not None
+
+
+def get_visitor_id(request) -> str:
+    """The anonymous id of the visitor, from the visitor cookie or new."""
+    if not hasattr(request, "visitor_id"):
+        visitor_id = request.COOKIES.get(settings.VISITOR_COOKIE_NAME, "")
+        request.visitor_is_new = VISITOR_ID_RE.fullmatch(visitor_id) is None
+        request.visitor_id = uuid.uuid4().hex if request.visitor_is_new else visitor_id
+    return request.visitor_id
+
+
+def remember_visitor(request, response) -> None:
+    if getattr(request, "visitor_is_new", False):
+        response.set_cookie(settings.VISITOR_COOKIE_NAME, request.visitor_id, max_age=settings.VISITOR_COOKIE_AGE,
+                            httponly=True, samesite="Lax")
+
+
+def _incr(key) -> int:
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, settings.PAGEVIEW_BUFFER_TIMEOUT):
+            return 1
+        return cache.incr(key)
+
+
+def _incr_views(key) -> int:
+    """Count a view and return the views counted by key. A new counter starts at a random epoch, so the
+    flush can tell a counter that was evicted and started again from the old one, whatever its value."""
+    try:
+        value = cache.incr(key)
+    except ValueError:
+        value = (random.randrange(1, 2 ** 30) << EPOCH_BITS) + 1
+        if not cache.add(key, value, settings.PAGEVIEW_BUFFER_TIMEOUT):
+            value = cache.incr(key)
+    return value & ((1 << EPOCH_BITS) - 1)
+
+
+def count_view(request, url: str) -> None:
+    """Count a view of url in the cache. The database is only written by flush_views."""
+    if is_bot(request):
+        return
+    date = timezone.localdate().isoformat()
+    if _incr_views(COUNTER_KEY.format(date=date, url=url)) == 1:
+        # The first view of the day registers the page in a numbered slot,
+        # so the flush can find every counter without scanning the cache.
+        number = _incr(SLOTS_KEY.format(date=date))
+        cache.set(SLOT_KEY.format(date=date, number=number), url, settings.PAGEVIEW_BUFFER_TIMEOUT)
+    # Visits are appended to one list per day and slot, the slot spreading the writes of a busy day.
+    visitor_id = get_visitor_id(request)
+    key = VISITS_KEY.format(date=date, slot=int(visitor_id[:8], 16) % settings.PAGEVIEW_VISIT_SLOTS)
+    try:
+        if get_redis().rpush(key, json.dumps([url, visitor_id, timezone.now().timestamp()])) == 1:
+            get_redis().expire(key, settings.PAGEVIEW_BUFFER_TIMEOUT)
+    except redis.RedisError:
+        # The view is already counted; only the visit record is lost.
+        logger.warning("Could not buffer a visit of %s", url, exc_info=True)
+
+
+def get_buffered_urls(date: datetime.date) -> set[str]:
+    date = date.isoformat()
+    slots = cache.get(SLOTS_KEY.format(date=date)) or 0
+    return set(cache.get_many([SLOT_KEY.format(date=date, number=number) for number in range(1, slots + 1)]).values())
+
+
+def flush_views(date: datetime.date) -> int:
+    """Store the views of a day counted since the previous flush and return their number.
+
+    Counters in the cache only ever grow. PageVisitFlush remembers how much of
+    every counter, and of which epoch of it, is already stored, and is updated in
+    the same transaction as the daily totals, so a flush that dies halfway is
+    simply repeated. Visits
+    are removed from their lists once stored; a flush that dies before that
+    reads them again, which only repeats rows of the visit log.
+    """
+    urls = get_buffered_urls(date)
+    keys = {COUNTER_KEY.format(date=date.isoformat(), url=url): url for url in urls}
+    counters = {keys[key]: views for key, views in cache.get_many(keys).items()}
+
+    with transaction.atomic():
+        # One flush at a time, so that two of them never take the same visits.
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", ["pageviews"])
+        # Concurrent flushes wait on the row locks, or fail on the unique constraint for new rows.
+        flushed = {mark.url: mark for mark in
+                   PageVisitFlush.objects.select_for_update().filter(date=date, url__in=counters)}
+        new_views, created, updated = {}, [], []
+        for url, value in counters.items():
+            epoch, views = divmod(value, 1 << EPOCH_BITS)
+            mark = flushed.get(url)
+            # A counter of another epoch was evicted and started again from zero.
+            done = mark.views if mark and mark.epoch == epoch else 0
+            count = views - done
+            if count <= 0:
+                continue
+            new_views[url] = count
+            if mark:
+                mark.views, mark.epoch = views, epoch
+                updated.append(mark)
+            else:
+                created.append(PageVisitFlush(url=url, date=date, views=views, epoch=epoch))
+        PageVisitFlush.objects.bulk_create(created)
+        PageVisitFlush.objects.bulk_update(updated, ["views", "epoch"])
+        add_daily_views(date, new_views)
+        visits = get_new_visits(date)
+        add_visitors(date, visits)
+        if settings.PAGEVIEW_STORE_VISITS:
+            PageVisit.objects.bulk_create((PageVisit(url=url, session_id=visitor_id, visit_time=visit_time)
+                                           for url, visitor_id, visit_time in visits), batch_size=1000)
+    return sum(new_views.values())
+
+
+def add_daily_views(date: datetime.date, views_by_url: dict[str, int]) -> None:
+    post_ids = dict(Women.objects.filter(slug__in=views_by_url).values_list("slug", "pk"))
+    views_by_post = {post_ids[url]: views for url, views in views_by_url.items() if url in post_ids}
+    rows = {row.post_id: row for row in
+            PostViewDaily.objects.select_for_update().filter(date=date, post_id__in=views_by_post)}
+    created, updated = [], []
+    for post_id, views in views_by_post.items():
+        row = rows.get(post_id)
+        if row:
+            row.views += views
+            updated.append(row)
+        else:
+            created.append(PostViewDaily(post_id=post_id, date=date, views=views))
+    PostViewDaily.objects.bulk_create(created)
+    PostViewDaily.objects.bulk_update(updated, ["views"])
+    add_views(views_by_post)
+
+
+def get_new_visits(date: datetime.date) -> list[tuple[str, str, datetime.datetime]]:
+    """The (url, visitor id, time) of the visits of a day buffered since the previous flush.
+    They are removed from the buffer when the transaction commits."""
+    client = get_redis()
+    take = client.register_script(TAKE_VISITS)
+    date = date.isoformat()
+    slots = [(VISITS_KEY.format(date=date, slot=slot), FLUSHING_KEY.format(date=date, slot=slot))
+             for slot in range(settings.PAGEVIEW_VISIT_SLOTS)]
+    pipeline = client.pipeline(transaction=False)
+    for keys in slots:
+        take(keys=keys, client=pipeline)
+    batches = pipeline.execute()
+    transaction.on_commit(lambda: client.delete(*(flushing for _, flushing in slots)))
+    return [(url, visitor_id, datetime.datetime.fromtimestamp(time, datetime.timezone.utc))
+            for batch in batches for url, visitor_id, time in map(json.loads, batch)]
+
+
+def add_visitors(date: datetime.date, visits) -> None:
+    """Add the visitors to the sketches of the day, week and month of their posts."""
+    visitors_by_url = defaultdict(set)
+    for url, visitor_id, _ in visits:
+        visitors_by_url[url].add(visitor_id)
+    post_ids = dict(Women.objects.filter(slug__in=visitors_by_url).values_list("slug", "pk"))
+    sketches = {post_ids[url]: hll.add(hll.empty(), visitors) for url, visitors in visitors_by_url.items()
+                if url in post_ids}
+    if not sketches:
+        return
+    starts = {period: PostVisitors.get_start(period, date) for period in PostVisitors.Period.values}
+    rows = {(row.post_id, row.period): row for row in PostVisitors.objects.select_for_update().filter(
+        post_id__in=sketches, period__in=starts, start__in=starts.values()) if row.start == starts[row.period]}
+    created, updated = [], []
+    for post_id, sketch in sketches.items():
+        for period, start in starts.items():
+            row = rows.get((post_id, period))
+            if row:
+                row.sketch = hll.merge(row.sketch, sketch)
+                updated.append(row)
+            else:
+                created.append(PostVisitors(post_id=post_id, period=period, start=start, sketch=sketch))
+    PostVisitors.objects.bulk_create(created)
+    PostVisitors.objects.bulk_update(updated, ["sketch"])
+
+
+def get_visitors(post_ids, period: str, date: datetime.date | None = None) -> dict[int, int]:
+    """Approximate number of distinct visitors of the posts over the period around date (default: today)."""
+    start = PostVisitors.get_start(period, date or timezone.localdate())
+    return {post_id: hll.count(sketch) for post_id, sketch in
+            PostVisitors.objects.filter(post_id__in=post_ids, period=period, start=start)
+            .values_list("post_id", "sketch")}
+
+
+def get_post_visitors(post_id: int, date: datetime.date | None = None) -> dict[str, int]:
+    """Approximate number of distinct visitors of a post today, this week and this month."""
+    date = date or timezone.localdate()
+    periods = Q()
+    for period in PostVisitors.Period.values:
+        periods |= Q(period=period, start=PostVisitors.get_start(period, date))
+    visitors = dict.fromkeys(PostVisitors.Period.values, 0)
+    for period, sketch in PostVisitors.objects.filter(periods, post_id=post_id).values_list("period", "sketch"):
+        visitors[period] = hll.count(sketch)
+    return visitors
@@ -0,0 +1,154 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import InvalidPage, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from . import cache
+
+CURSOR_SALT = "women.paginators.cursor"
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f"<Keyset page of {len(self.object_list)} items>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Seek pagination over ("-time_create", "-id").
+
+    Every page is fetched with a range condition on the last seen row instead of
+    OFFSET, so the cost of a page does not depend on how deep it is, and no
+    COUNT(*) is needed.
+    """
+    uses_cursor = True
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+
+    @staticmethod
+    def encode_cursor(obj, direction):
+        return signing.dumps([obj.time_create.isoformat(), obj.pk, direction], salt=CURSOR_SALT, compress=True)
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            time_create, pk, direction = signing.loads(cursor, salt=CURSOR_SALT)
+            time_create = parse_datetime(time_create)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise InvalidCursor("Invalid cursor")
+        if time_create is None or direction not in ("next", "prev"):
+            raise InvalidCursor("Invalid cursor")
+        return time_create, int(pk), direction
+
+    def page(self, cursor=None):
+        if not cursor:
+            rows = list(self.queryset.order_by("-time_create", "-id")[:self.per_page + 1])
+            return self._make_page(rows[:self.per_page], has_next=len(rows) > self.per_page, has_previous=False)
+
+        time_create, pk, direction = self.decode_cursor(cursor)
+        if direction == "next":
+            queryset = self.queryset.filter(Q(time_create__lt=time_create) | Q(time_create=time_create, id__lt=pk))
+            rows = list(queryset.order_by("-time_create", "-id")[:self.per_page + 1])
+            return self._make_page(rows[:self.per_page], has_next=len(rows) > self.per_page, has_previous=True)
+
+        queryset = self.queryset.filter(Q(time_create__gt=time_create) | Q(time_create=time_create, id__gt=pk))
+        rows = list(queryset.order_by("time_create", "id")[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        return self._make_page(rows[:self.per_page][::-1], has_next=True, has_previous=has_previous)
+
+    def _make_page(self, object_list, has_next, has_previous):
+        next_cursor = self.encode_cursor(object_list[-1], "next") if has_next and object_list else None
+        previous_cursor = self.encode_cursor(object_list[0], "prev") if has_previous and object_list else None
+        return KeysetPage(object_list, self, next_cursor, previous_cursor)
+
+
+class CountingPaginator(Paginator):
+    """Paginator that counts a queryset at most once per cache generation.
+
+    The count is cached under the SQL of the queryset and the view's cache tags,
+    so it is shared by every page and dropped whenever posts in that scope change.
+    The last count of every queryset is also kept without tags: once it was above
+    PAGINATOR_ESTIMATE_THRESHOLD, the planner is asked first, and if it still
+    expects that many rows its estimate is used instead of an exact COUNT(*) and
+    is_estimated is set. Smaller listings are always counted exactly.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, cache_tags=()):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.cache_tags = cache_tags
+        self.is_estimated = False
+
+    def get_signature(self):
+        sql, params = self.object_list.query.sql_with_params()
+        return hashlib.md5(f"{self.object_list.db}:{sql}:{params!r}".encode()).hexdigest()
+
+    @cached_property
+    def count(self):
+        try:
+            signature = self.get_signature()
+        except (AttributeError, EmptyResultSet):
+            return Paginator.count.func(self)
+
+        key = f"paginator_count:{signature}"
+        cached = cache.get_tagged(key, self.cache_tags)
+        if cached is None:
+            threshold = settings.PAGINATOR_ESTIMATE_THRESHOLD
+            last_key = f"paginator_last_count:{signature}"
+            last_count = cache.get_tagged(last_key, ())
+            estimate = self.estimate_count() if last_count is not None and last_count >= threshold else None
+            if estimate is not None and estimate >= threshold:
+                cached = (estimate, True)
+            else:
+                cached = (Paginator.count.func(self), False)
+            cache.set_tagged(key, cached, self.cache_tags)
+            cache.set_tagged(last_key, cached[0], (), timeout=settings.PAGINATOR_LAST_COUNT_TIMEOUT)
+
+        count, self.is_estimated = cached
+        return count
+
+    def estimate_count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return None
+
+        sql, params = queryset.order_by().values("pk").query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
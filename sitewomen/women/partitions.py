@@ -0,0 +1,114 @@
+"""Daily range partitions of the PageVisit table.
+
+On PostgreSQL the table is partitioned by visit_time (see migration 0023), one
+partition per local day, plus a default partition so that inserts never fail
+when the partitions ahead were not created in time. Old days are removed by
+detaching and dropping their partitions, which costs the same however many
+visits they hold. Other databases fall back to deleting rows in chunks.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from .models import PageVisit
+
+TABLE = PageVisit._meta.db_table
+PARTITION_PREFIX = f"{TABLE}_p"
+
+
+def partition_name(day: datetime.date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def day_bounds(day: datetime.date) -> tuple[datetime.datetime, datetime.datetime]:
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    end = timezone.make_aware(datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time.min))
+    return start, end
+
+
+def is_partitioned() -> bool:
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == "p"
+
+
+def get_partitions() -> dict[datetime.date, str]:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                       "WHERE i.inhparent = %s::regclass", [TABLE])
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        if name.startswith(PARTITION_PREFIX):
+            try:
+                partitions[datetime.datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").date()] = name
+            except ValueError:
+                continue
+    return partitions
+
+
+def create_partitions(start: datetime.date, end: datetime.date) -> list[str]:
+    """Create the missing daily partitions from start to end inclusive."""
+    existing = get_partitions()
+    created = []
+    day = start
+    while day <= end:
+        if day not in existing:
+            lower, upper = day_bounds(day)
+            try:
+                # A day whose rows already landed in the default partition cannot get its own
+                # partition; those rows are removed by the chunked delete instead.
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute(f"CREATE TABLE {connection.ops.quote_name(partition_name(day))} "
+                                   f"PARTITION OF {connection.ops.quote_name(TABLE)} "
+                                   f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')")
+                created.append(partition_name(day))
+            except DatabaseError:
+                pass
+        day += datetime.timedelta(days=1)
+    return created
+
+
+def ensure_partitions() -> list[str]:
+    if not is_partitioned():
+        return []
+    today = timezone.localdate()
+    return create_partitions(today, today + datetime.timedelta(days=settings.PAGEVIEW_PARTITIONS_AHEAD))
+
+
+def drop_partitions(before: datetime.date) -> list[str]:
+    """Detach and drop every daily partition older than before."""
+    dropped = []
+    for day, name in sorted(get_partitions().items()):
+        if day >= before:
+            break
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {connection.ops.quote_name(TABLE)} "
+                           f"DETACH PARTITION {connection.ops.quote_name(name)}")
+            cursor.execute(f"DROP TABLE {connection.ops.quote_name(name)}")
+        dropped.append(name)
+    return dropped
+
+
+def delete_visits(before: datetime.datetime, chunk_size: int = 5000) -> int:
+    """Delete visits older than before in short transactions of chunk_size rows."""
+    deleted = 0
+    while True:
+        ids = list(PageVisit.objects.filter(visit_time__lt=before).values_list("pk", flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += PageVisit.objects.filter(visit_time__lt=before, pk__in=ids).delete()[0]
+
+
+def apply_retention() -> None:
+    """Keep the visits of the last PAGEVIEW_RETENTION_DAYS days."""
+    cutoff = timezone.localdate() - datetime.timedelta(days=settings.PAGEVIEW_RETENTION_DAYS)
+    if is_partitioned():
+        drop_partitions(cutoff)
+    # Without partitions this does all the work; with them it only clears the default partition.
+    delete_visits(day_bounds(cutoff)[0])
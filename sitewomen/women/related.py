@@ -0,0 +1,94 @@
+"""Similar posts by tag overlap.
+
+Every published post keeps its RELATED_POSTS_COUNT most similar published
+posts in RelatedPost, scored by the Jaccard index of their tag sets. A change
+to the tags or the publication of a post only changes the scores of posts that
+share a tag with it, so only those are recomputed, in a Celery task scheduled
+when the change is committed.
+"""
+import heapq
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import Women, RelatedPost
+
+PostTag = Women.tags.through
+
+
+def get_affected_posts(post_ids, tag_ids=()) -> set[int]:
+    """The posts whose similar posts may change when post_ids change their tags from or to tag_ids."""
+    tag_ids = set(tag_ids) | set(PostTag.objects.filter(women_id__in=post_ids).values_list("tagpost_id", flat=True))
+    return set(post_ids) | set(PostTag.objects.filter(tagpost_id__in=tag_ids).values_list("women_id", flat=True))
+
+
+def get_tag_neighbours(post_ids, limit: int) -> dict[int, list[tuple[float, int]]]:
+    """Up to limit (score, post_id) pairs of the most similar published posts of every published post."""
+    tags = defaultdict(set)
+    for post_id, tag_id in PostTag.objects.filter(women_id__in=post_ids,
+                                                   women__is_published=Women.Status.PUBLISHED
+                                                   ).values_list("women_id", "tagpost_id"):
+        tags[post_id].add(tag_id)
+
+    posts_by_tag = defaultdict(list)
+    for post_id, tag_id in PostTag.objects.filter(tagpost_id__in=set().union(*tags.values()),
+                                                   women__is_published=Women.Status.PUBLISHED
+                                                   ).values_list("women_id", "tagpost_id"):
+        posts_by_tag[tag_id].append(post_id)
+    candidates = {post_id for posts in posts_by_tag.values() for post_id in posts}
+    sizes = dict(PostTag.objects.filter(women_id__in=candidates).values("women_id")
+                 .annotate(count=Count("pk")).values_list("women_id", "count"))
+
+    neighbours = {}
+    for post_id, post_tags in tags.items():
+        shared = Counter(other for tag_id in post_tags for other in posts_by_tag[tag_id] if other != post_id)
+        neighbours[post_id] = heapq.nlargest(limit, ((count / (len(post_tags) + sizes[other] - count), other)
+                                                    for other, count in shared.items()))
+    return neighbours
+
+
+def update_related_posts(post_ids) -> int:
+    """Recompute the similar posts of post_ids and return the number of rows stored."""
+    post_ids = set(post_ids)
+    neighbours = get_tag_neighbours(post_ids, settings.RELATED_POSTS_COUNT)
+    rows = [RelatedPost(post_id=post_id, related_id=related_id, score=score, source=RelatedPost.Source.TAGS)
+            for post_id, pairs in neighbours.items() for score, related_id in pairs]
+    with transaction.atomic():
+        RelatedPost.objects.filter(post_id__in=post_ids, source=RelatedPost.Source.TAGS).delete()
+        RelatedPost.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def schedule_update(post_ids=(), tag_ids=(), content=False) -> None:
+    """Recompute the similar posts after the commit; content=True when the posts were published or removed."""
+    from .tasks import update_related_posts as task, update_content_neighbours as content_task
+
+    post_ids, tag_ids = sorted(set(post_ids)), sorted(set(tag_ids))
+    if post_ids or tag_ids:
+        transaction.on_commit(lambda: task.delay(post_ids, tag_ids))
+    if content and post_ids:
+        transaction.on_commit(lambda: content_task.delay(post_ids))
+
+
+def get_related_posts(post, limit: int, language: str):
+    """The posts most similar to post, blending the tag and content scores by RELATED_POSTS_TAG_WEIGHT."""
+    links = (post.related_links.filter(Q(source=RelatedPost.Source.TAGS) |
+                                       Q(source=RelatedPost.Source.CONTENT, language=language))
+             .filter(related__is_published=Women.Status.PUBLISHED).select_related("related"))
+    weights = {RelatedPost.Source.TAGS: settings.RELATED_POSTS_TAG_WEIGHT,
+               RelatedPost.Source.CONTENT: 1 - settings.RELATED_POSTS_TAG_WEIGHT}
+    scores, posts = defaultdict(float), {}
+    for link in links:
+        scores[link.related_id] += weights[link.source] * link.score
+        posts[link.related_id] = link.related
+    best = sorted(scores, key=lambda pk: (scores[pk], pk), reverse=True)[:limit]
+    return [posts[pk] for pk in best]
+
+
+def get_also_viewed(post, limit: int):
+    """The posts most often read by the readers of post, as found by women.covisitation."""
+    return [link.related for link in post.related_links.filter(source=RelatedPost.Source.VISITS,
+                                                                related__is_published=Women.Status.PUBLISHED)
+            .select_related("related")[:limit]]
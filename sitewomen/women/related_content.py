@@ -0,0 +1,271 @@
+"""Similar posts by content.
+
+Every language has a TF-IDF matrix of the published posts' content_<language>
+field. Words are hashed into RELATED_CONTENT_DIMENSIONS columns, so the matrix
+never needs a vocabulary and a post can be added without touching the others.
+Rows are L2-normalised float32 vectors, kept in a .npy file under
+RELATED_CONTENT_DIR and memory-mapped, so only the rows being compared are
+read. Row slots of removed posts are reused; the file is copied to one twice
+as large when full.
+
+The RELATED_POSTS_COUNT best cosine neighbours of every post are stored in
+RelatedPost. Changing a post recomputes its neighbours and those of the posts
+it may enter or leave, found with one matrix product against the changed rows.
+
+Every worker must see the same RELATED_CONTENT_DIR (a volume of the celery
+service): writes to it are ordered by an advisory lock of the database. Files
+are not rolled back with the transaction, so they are written copy-on-write:
+which post is in which slot lives in a small state file, replaced as a whole
+once the neighbours are committed, and vectors are only written to slots free
+in that state or to a new file. A failed update leaves the last committed
+state as it was. Without a state a language is skipped with an error; only
+rebuild_related_posts builds it.
+"""
+import contextlib
+import glob
+import logging
+import math
+import os
+import re
+import uuid
+import zlib
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.html import strip_tags
+
+from .models import Women, RelatedPost
+
+WORD_RE = re.compile(r"\w\w+")
+MIN_CAPACITY = 1024
+
+logger = logging.getLogger(__name__)
+
+
+def get_languages() -> list[str]:
+    return [code for code, _ in settings.LANGUAGES]
+
+
+def get_term_counts(text: str, dimensions: int) -> Counter:
+    # crc32 rather than hash(), which differs between processes.
+    return Counter(zlib.crc32(word.encode()) % dimensions for word in WORD_RE.findall(strip_tags(text).lower()))
+
+
+def get_vectors(counts: list[Counter], idf: np.ndarray) -> np.ndarray:
+    vectors = np.zeros((len(counts), len(idf)), dtype=np.float32)
+    for row, terms in enumerate(counts):
+        if terms:
+            columns = np.fromiter(terms.keys(), dtype=np.int64, count=len(terms))
+            frequencies = np.fromiter(terms.values(), dtype=np.float32, count=len(terms))
+            vectors[row, columns] = (1 + np.log(frequencies)) * idf[columns]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def grow(array, capacity: int, dtype) -> np.ndarray:
+    grown = np.zeros(capacity, dtype=dtype)
+    if array is not None:
+        grown[:len(array)] = array
+    return grown
+
+
+class ContentMatrix:
+    """The vectors of one language: ids[slot] is the post in a row slot, 0 for a free slot.
+    kth[slot] is the score of the weakest stored neighbour, 0 while there are fewer than the limit.
+    Changes only become the state other workers open with commit()."""
+
+    def __init__(self, language: str, directory=None):
+        self.language = language
+        self.directory = directory or settings.RELATED_CONTENT_DIR
+        self.dimensions = settings.RELATED_CONTENT_DIMENSIONS
+        self.limit = settings.RELATED_POSTS_COUNT
+        self.ids = self.vectors = self.kth = self.idf = self.vectors_name = None
+        # The slots used by the committed state, whose vectors must stay as they are.
+        self.committed_ids = np.zeros(0, dtype=np.int64)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{self.language}.{name}")
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path("state.npz"))
+
+    def open(self) -> None:
+        with np.load(self.path("state.npz")) as state:
+            self.ids, self.kth, self.idf = state["ids"], state["kth"], state["idf"]
+            self.vectors_name = str(state["vectors"])
+        self.vectors = np.load(self.path(self.vectors_name), mmap_mode="r+")
+        self.committed_ids = self.ids.copy()
+
+    def allocate(self, capacity: int) -> None:
+        """Copy the vectors to a new file with room for capacity rows."""
+        name = f"vectors.{uuid.uuid4().hex}.npy"
+        vectors = np.lib.format.open_memmap(self.path(name), mode="w+", dtype=np.float32,
+                                            shape=(capacity, self.dimensions))
+        if self.vectors is not None:
+            vectors[:len(self.vectors)] = self.vectors
+        self.vectors, self.vectors_name = vectors, name
+        self.ids = grow(self.ids, capacity, np.int64)
+        self.kth = grow(self.kth, capacity, np.float32)
+
+    def commit(self) -> None:
+        """Replace the state other workers open with this one, and remove the vectors files it does not use."""
+        self.vectors.flush()
+        tmp = self.path(f"state.{uuid.uuid4().hex}.tmp")
+        with open(tmp, "wb") as file:
+            np.savez(file, ids=self.ids, kth=self.kth, idf=self.idf, vectors=np.array(self.vectors_name))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, self.path("state.npz"))
+        self.committed_ids = self.ids.copy()
+        # Left over by replaced states, failed updates and crashed workers.
+        for path in glob.glob(self.path("vectors.*.npy")) + glob.glob(self.path("state.*.tmp")):
+            if os.path.basename(path) != f"{self.language}.{self.vectors_name}":
+                os.remove(path)
+
+    def get_texts(self, post_ids=None) -> dict[int, str]:
+        posts = Women.published.all()
+        if post_ids is not None:
+            posts = posts.filter(pk__in=post_ids)
+        field = f"content_{self.language}"
+        return {pk: text for pk, text in posts.exclude(**{f"{field}__isnull": True}).exclude(**{field: ""})
+                .values_list("pk", field).iterator(chunk_size=2000)}
+
+    def build(self) -> int:
+        """Vectorise every published post from scratch and store the neighbours of all of them."""
+        texts = self.get_texts()
+        post_ids = list(texts)
+        counts = [get_term_counts(texts.pop(pk), self.dimensions) for pk in post_ids]
+        document_frequency = np.zeros(self.dimensions, dtype=np.float64)
+        for terms in counts:
+            document_frequency[list(terms)] += 1
+        os.makedirs(self.directory, exist_ok=True)
+        self.idf = (np.log((1 + len(counts)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        self.ids = self.vectors = self.kth = None
+        self.allocate(max(MIN_CAPACITY, 2 ** math.ceil(math.log2(len(post_ids) + 1))))
+        batch_size = settings.RELATED_CONTENT_BATCH_SIZE
+        for start in range(0, len(post_ids), batch_size):
+            batch = counts[start:start + batch_size]
+            self.vectors[start:start + len(batch)] = get_vectors(batch, self.idf)
+        self.ids[:len(post_ids)] = post_ids
+
+        with transaction.atomic():
+            RelatedPost.objects.filter(source=RelatedPost.Source.CONTENT, language=self.language).delete()
+            return self.store_neighbours(np.arange(len(post_ids)))
+
+    def get_slots(self, post_ids) -> dict[int, int]:
+        slots = np.flatnonzero(np.isin(self.ids, list(post_ids)))
+        return {int(self.ids[slot]): int(slot) for slot in slots}
+
+    def get_free_slots(self) -> np.ndarray:
+        free = self.ids == 0
+        # Slots freed since the commit still hold vectors of the committed state.
+        free[:len(self.committed_ids)] &= self.committed_ids == 0
+        return np.flatnonzero(free)
+
+    def take_free_slots(self, count: int) -> np.ndarray:
+        free = self.get_free_slots()
+        if len(free) < count:
+            self.allocate(2 ** math.ceil(math.log2(len(self.ids) + count - len(free))))
+            free = self.get_free_slots()
+        return free[:count]
+
+    def get_neighbours(self, slots: np.ndarray):
+        """Yield (slot, neighbour slots, scores) with the best neighbours of every slot, best first."""
+        valid = self.ids != 0
+        limit = min(self.limit, max(int(valid.sum()) - 1, 0))
+        for start in range(0, len(slots), settings.RELATED_CONTENT_BATCH_SIZE):
+            batch = slots[start:start + settings.RELATED_CONTENT_BATCH_SIZE]
+            scores = np.asarray(self.vectors[batch]) @ np.asarray(self.vectors).T
+            scores[:, ~valid] = -1
+            scores[np.arange(len(batch)), batch] = -1
+            if limit == 0:
+                for slot in batch:
+                    yield slot, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+                continue
+            best = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+            best_scores = np.take_along_axis(scores, best, axis=1)
+            order = np.argsort(-best_scores, axis=1, kind="stable")
+            best, best_scores = np.take_along_axis(best, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+            for slot, neighbours, neighbour_scores in zip(batch, best, best_scores):
+                keep = neighbour_scores > 0
+                yield slot, neighbours[keep], neighbour_scores[keep]
+
+    def store_neighbours(self, slots: np.ndarray) -> int:
+        rows = []
+        for slot, neighbours, scores in self.get_neighbours(slots):
+            self.kth[slot] = scores[-1] if len(scores) == self.limit else 0
+            rows.extend(RelatedPost(post_id=int(self.ids[slot]), related_id=int(self.ids[neighbour]),
+                                    score=float(score), source=RelatedPost.Source.CONTENT, language=self.language)
+                        for neighbour, score in zip(neighbours, scores))
+        RelatedPost.objects.bulk_create(rows, batch_size=1000)
+        return len(rows)
+
+    def update(self, post_ids) -> int:
+        """Revectorise post_ids, or remove those no longer published, and refresh the affected neighbours."""
+        post_ids = set(post_ids)
+        texts = self.get_texts(post_ids)
+        # Changed posts move to new slots, the rows of the committed state are never overwritten.
+        for slot in self.get_slots(post_ids).values():
+            self.ids[slot] = 0
+            self.kth[slot] = 0
+        changed = self.take_free_slots(len(texts)).astype(np.int64)
+        self.vectors[changed] = get_vectors([get_term_counts(texts[pk], self.dimensions) for pk in texts], self.idf)
+        self.ids[changed] = list(texts)
+
+        # Posts that now rank a changed post above their weakest neighbour, and posts that listed one of them.
+        affected = set(changed.tolist())
+        if len(changed):
+            valid = np.flatnonzero(self.ids != 0)
+            best = (np.asarray(self.vectors[valid]) @ np.asarray(self.vectors[changed]).T).max(axis=1)
+            affected.update(valid[best > np.asarray(self.kth[valid])].tolist())
+        links = RelatedPost.objects.filter(source=RelatedPost.Source.CONTENT, language=self.language)
+        listing = set(links.filter(related_id__in=post_ids).values_list("post_id", flat=True))
+        affected.update(self.get_slots(listing).values())
+        affected_ids = {int(self.ids[slot]) for slot in affected} | post_ids
+        links.filter(post_id__in=affected_ids).delete()
+        return self.store_neighbours(np.array(sorted(affected), dtype=np.int64))
+
+
+@contextlib.contextmanager
+def lock(language: str):
+    # Workers take turns on the files of a language until its new state is in place, after the commit.
+    if connection.vendor != "postgresql":
+        yield
+        return
+    key = f"related_content:{language}"
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(hashtext(%s))", [key])
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", [key])
+
+
+def run_locked(language: str, action) -> int:
+    matrix = ContentMatrix(language)
+    with lock(language):
+        with transaction.atomic(durable=True):
+            stored = action(matrix)
+        if matrix.ids is not None:
+            matrix.commit()
+    return stored
+
+
+def update_posts(post_ids) -> int:
+    def update(matrix):
+        if not matrix.exists():
+            logger.error("No content matrix of %s, run rebuild_related_posts", matrix.language)
+            return 0
+        matrix.open()
+        return matrix.update(post_ids)
+
+    return sum(run_locked(language, update) for language in get_languages())
+
+
+def rebuild() -> int:
+    return sum(run_locked(language, ContentMatrix.build) for language in get_languages())
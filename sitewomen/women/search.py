@@ -0,0 +1,21 @@
+import unicodedata
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+class SearchResults(list):
+    """Ranked ids of the posts found for a query.
+
+    Paginating it costs nothing; only the ids of the requested page are loaded
+    from the queryset.
+    """
+
+    def __init__(self, ids, queryset):
+        super().__init__(ids)
+        self.queryset = queryset
+
+    def hydrate(self, ids):
+        posts = self.queryset.in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
@@ -0,0 +1,46 @@
+"""Translation of rich text one block at a time.
+
+CKEditor content is split on its block-level tags (paragraphs, list items,
+headings, table cells...) into segments of text with their inline markup, and
+only the segments are translated; the block markup is kept as it is. Segments
+go through the translation memory, which keys them by their hash, so after an
+edit only the segments that changed are sent to the translator. Plain text,
+like comments, is a single segment.
+"""
+import re
+
+from . import translation_memory, translators
+
+BLOCK_TAG_RE = re.compile(r"(</?(?:address|article|aside|blockquote|caption|dd|div|dl|dt|figcaption|figure|footer|"
+                          r"h[1-6]|header|hr|li|ol|p|pre|section|table|tbody|td|tfoot|th|thead|tr|ul)\b[^>]*>)",
+                          re.IGNORECASE)
+
+
+def split(html: str) -> list[str]:
+    """The content as text and block tags in turn: the parts at even positions are text."""
+    return BLOCK_TAG_RE.split(html)
+
+
+def get_segments(parts: list[str]) -> list[str]:
+    return [part.strip() for part in parts[::2] if part.strip()]
+
+
+def translate(html: str, language: str, translator=None) -> tuple[dict[str, str], list]:
+    """Like translators.translate, for rich text. A language is left out if any of its segments failed."""
+    parts = split(html)
+    translations, errors = translation_memory.translate_many(get_segments(parts), language, translator)
+    results = {}
+    for target in translators.get_targets(language):
+        translated = []
+        for index, part in enumerate(parts):
+            segment = part.strip()
+            if index % 2 or not segment:
+                translated.append(part)
+            elif target in translations[segment]:
+                # Keeps the whitespace around the segment.
+                translated.append(part.replace(segment, translations[segment][target], 1))
+            else:
+                break
+        else:
+            results[target] = "".join(translated)
+    return results, errors
@@ -0,0 +1,209 @@
+from collections import Counter
+
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .cache import (CATALOG_TAG, invalidate_tags, get_post_cache_tags,
+                    category_tag, comments_tag, tag_tag)
+from .counters import increment
+from .models import Women, Category, TagPost, Rating, Comment
+from .related import schedule_update
+from .suggest import SUGGEST_FIELDS, suggest_index
+
+
+@receiver(pre_save, sender=Women)
+def remember_previous_category(sender, instance, raw, **kwargs):
+    instance._previous_cat_id = instance._previous_is_published = None
+    instance._previous_title = instance._previous_slug = None
+    if instance.pk and not raw:
+        previous = (Women.objects.filter(pk=instance.pk)
+                    .values_list("cat_id", "is_published", "title", "slug").first())
+        if previous is not None:
+            (instance._previous_cat_id, instance._previous_is_published,
+             instance._previous_title, instance._previous_slug) = previous
+
+
+@receiver(pre_delete, sender=Women)
+def remember_deleted_post_tags(sender, instance, **kwargs):
+    instance._tag_ids = set(instance.tags.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Women)
+@receiver(post_delete, sender=Women)
+def invalidate_post_cache(sender, instance, **kwargs):
+    if kwargs.get("raw"):
+        return
+    cat_ids = {instance.cat_id, getattr(instance, "_previous_cat_id", None)}
+    tag_ids = getattr(instance, "_tag_ids", None)
+    if tag_ids is None:
+        tag_ids = set(instance.tags.values_list("pk", flat=True))
+    invalidate_tags(*get_post_cache_tags(cat_ids=cat_ids, tag_ids=tag_ids, post_ids=[instance.pk]))
+
+
+@receiver(post_save, sender=Women)
+def update_post_search_vectors(sender, instance, **kwargs):
+    if kwargs.get("raw"):
+        return
+    Women.objects.filter(pk=instance.pk).update_search_vectors()
+
+
+@receiver(m2m_changed, sender=Women.tags.through)
+def invalidate_post_tags_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear":
+        # pk_set is not provided for clear, so the affected rows are collected before they go away.
+        # Both sides of the relation use the "tags" accessor.
+        instance._cleared_pks = set(instance.tags.values_list("pk", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if action == "post_clear":
+        pk_set = getattr(instance, "_cleared_pks", set())
+    if not reverse:
+        posts = [instance]
+        tag_ids = set(pk_set or ())
+    else:
+        posts = list(Women.objects.filter(pk__in=pk_set or ()).only("pk", "cat_id"))
+        tag_ids = {instance.pk}
+    invalidate_tags(*get_post_cache_tags(cat_ids={post.cat_id for post in posts},
+                                         tag_ids=tag_ids, post_ids=[post.pk for post in posts]))
+
+
+@receiver(post_save, sender=Women)
+@receiver(post_delete, sender=Women)
+def update_post_related_posts(sender, instance, signal, **kwargs):
+    if kwargs.get("raw"):
+        return
+    if signal is post_delete:
+        schedule_update(post_ids=[instance.pk], tag_ids=instance._tag_ids, content=True)
+    elif instance.is_published != getattr(instance, "_previous_is_published", None):
+        schedule_update(post_ids=[instance.pk], content=True)
+
+
+@receiver(m2m_changed, sender=Women.tags.through)
+def update_tags_related_posts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if action == "post_clear":
+        # Collected on pre_clear by invalidate_post_tags_cache.
+        pk_set = getattr(instance, "_cleared_pks", set())
+    if not reverse:
+        schedule_update(post_ids=[instance.pk], tag_ids=pk_set or ())
+    else:
+        schedule_update(post_ids=pk_set or (), tag_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, instance, **kwargs):
+    if not kwargs.get("raw"):
+        invalidate_tags(CATALOG_TAG, category_tag(instance.pk))
+
+
+@receiver(post_save, sender=TagPost)
+@receiver(post_delete, sender=TagPost)
+def invalidate_tagpost_cache(sender, instance, **kwargs):
+    if not kwargs.get("raw"):
+        invalidate_tags(CATALOG_TAG, tag_tag(instance.pk))
+
+
+@receiver(post_save, sender=Women)
+@receiver(post_delete, sender=Women)
+def update_post_suggestions(sender, instance, signal, **kwargs):
+    if kwargs.get("raw"):
+        return
+    if signal is post_delete:
+        suggest_index.post_changed(instance.pk)
+        return
+    update_fields = kwargs.get("update_fields")
+    if update_fields is not None and not update_fields & SUGGEST_FIELDS:
+        return
+    was_indexed = getattr(instance, "_previous_is_published", None) == Women.Status.PUBLISHED
+    if instance.is_published != Women.Status.PUBLISHED:
+        if was_indexed:
+            suggest_index.post_changed(instance.pk)
+    elif not was_indexed or (instance.title, instance.slug) != (instance._previous_title, instance._previous_slug):
+        suggest_index.post_changed(instance.pk, instance.title, instance.slug)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def update_category_suggestions(sender, instance, signal, **kwargs):
+    if not kwargs.get("raw"):
+        suggest_index.category_changed(instance, deleted=signal is post_delete)
+
+
+@receiver(post_save, sender=TagPost)
+@receiver(post_delete, sender=TagPost)
+def update_tag_suggestions(sender, instance, signal, **kwargs):
+    if not kwargs.get("raw"):
+        suggest_index.tag_changed(instance, deleted=signal is post_delete)
+
+
+def get_rating_deltas(value, sign):
+    return {"likes": sign if value == 1 else 0, "dislikes": sign if value == -1 else 0}
+
+
+@receiver(pre_save, sender=Rating)
+def remember_previous_rating(sender, instance, raw, **kwargs):
+    instance._previous_value = None
+    if instance.pk and not raw:
+        instance._previous_value = Rating.objects.filter(pk=instance.pk).values_list("value", flat=True).first()
+
+
+@receiver(post_save, sender=Rating)
+def count_rating(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    deltas = get_rating_deltas(instance.value, 1)
+    for field, delta in get_rating_deltas(instance._previous_value, -1).items():
+        deltas[field] += delta
+    increment(instance.post_id, **deltas)
+
+
+@receiver(post_delete, sender=Rating)
+def uncount_rating(sender, instance, **kwargs):
+    increment(instance.post_id, **get_rating_deltas(instance.value, -1))
+
+
+def is_counted_comment(comment):
+    # Posts show the number of active top-level comments.
+    return comment.active and comment.parent_id is None
+
+
+@receiver(pre_save, sender=Comment)
+def remember_previous_comment(sender, instance, raw, **kwargs):
+    instance._previous_counted = None
+    if instance.pk and not raw:
+        previous = Comment.objects.filter(pk=instance.pk).only("post_id", "active", "parent_id").first()
+        if previous is not None:
+            instance._previous_counted = (previous.post_id, is_counted_comment(previous))
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    deltas = Counter()
+    if instance._previous_counted is not None:
+        post_id, counted = instance._previous_counted
+        deltas[post_id] -= counted
+    deltas[instance.post_id] += is_counted_comment(instance)
+    for post_id, delta in deltas.items():
+        increment(post_id, comments_count=delta)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_tree(sender, instance, **kwargs):
+    if kwargs.get("raw"):
+        return
+    post_ids = {instance.post_id}
+    if getattr(instance, "_previous_counted", None) is not None:
+        post_ids.add(instance._previous_counted[0])
+    invalidate_tags(*(comments_tag(pk) for pk in post_ids))
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    if is_counted_comment(instance):
+        increment(instance.post_id, comments_count=-1)
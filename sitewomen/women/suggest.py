@@ -0,0 +1,210 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from django.db import connection, transaction
+
+from . import cache
+from .search import normalize_query
+
+MAX_LIMIT = 20
+# A process further behind than this rebuilds its index instead of replaying the changes.
+MAX_REPLAYED_CHANGES = 1000
+CHANGE_KEY = "suggest:change:{}"
+# The fields of a post the index depends on.
+SUGGEST_FIELDS = {"title", "slug", "is_published"}
+
+
+def get_terms(label: str) -> set[str]:
+    words = normalize_query(label).split()
+    return {" ".join(words[i:]) for i in range(len(words))}
+
+
+class PrefixIndex:
+    """Labels kept as a sorted array of (term, pk) pairs.
+
+    Every word of a label starts its own term, so "джоли" finds "Анджелина Джоли".
+    A lookup is a binary search followed by a scan of about `limit` entries.
+    """
+
+    def __init__(self, items=()):
+        self.items = {}
+        self.terms = []
+        for pk, label, slug in items:
+            self.items[pk] = (label, slug)
+            self.terms.extend((term, pk) for term in get_terms(label))
+        self.terms.sort()
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, pk, label, slug):
+        self.remove(pk)
+        self.items[pk] = (label, slug)
+        for term in get_terms(label):
+            bisect.insort(self.terms, (term, pk))
+
+    def remove(self, pk):
+        item = self.items.pop(pk, None)
+        if item is None:
+            return
+        for term in get_terms(item[0]):
+            i = bisect.bisect_left(self.terms, (term, pk))
+            if i < len(self.terms) and self.terms[i] == (term, pk):
+                del self.terms[i]
+
+    def search(self, prefix: str, limit: int) -> list[tuple[str, str]]:
+        found = {}
+        i = bisect.bisect_left(self.terms, (prefix,))
+        while i < len(self.terms) and len(found) < limit:
+            term, pk = self.terms[i]
+            if not term.startswith(prefix):
+                break
+            item = self.items.get(pk)
+            if item is not None:
+                found.setdefault(pk, item)
+            i += 1
+        return list(found.values())
+
+
+def get_translated_labels(obj, field: str) -> dict[str, str]:
+    return {language: getattr(obj, f"{field}_{language}") or getattr(obj, field)
+            for language in settings.MODELTRANSLATION_LANGUAGES}
+
+
+class SuggestIndex:
+    """Prefix indexes of published post titles, tags and categories for every language.
+
+    The indexes live in the memory of each process and are built on first use.
+    Every change is applied in place after commit and published in the cache under
+    the generation of SUGGEST_TAG it bumped. Other processes check the generation
+    at most every SUGGEST_CHECK_INTERVAL seconds and replay the changes they missed;
+    only when some are gone from the cache is the index rebuilt, in a background
+    thread, while the stale one keeps serving.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.posts = None
+        self.tags = {}
+        self.categories = {}
+        self.version = None
+        self.checked_at = None
+        self.rebuilding = False
+
+    def _load_translated(self, model, field):
+        languages = settings.MODELTRANSLATION_LANGUAGES
+        rows = list(model.objects.values_list("pk", "slug", field, *(f"{field}_{lang}" for lang in languages)))
+        return {
+            language: PrefixIndex((pk, labels[i] or default, slug) for pk, slug, default, *labels in rows)
+            for i, language in enumerate(languages)
+        }
+
+    def _build(self, version):
+        from .models import Women, Category, TagPost
+
+        posts = PrefixIndex(Women.published.values_list("pk", "title", "slug").iterator())
+        tags = self._load_translated(TagPost, "tag")
+        categories = self._load_translated(Category, "name")
+        with self._lock:
+            # Changes committed during the build come after version, so the next check replays them.
+            self.posts, self.tags, self.categories, self.version = posts, tags, categories, version
+
+    def _rebuild(self, version):
+        try:
+            self._build(version)
+        finally:
+            self.rebuilding = False
+            connection.close()
+
+    def _replay(self, version) -> bool:
+        if self.version is None or not 0 < version - self.version <= MAX_REPLAYED_CHANGES:
+            return False
+        keys = [CHANGE_KEY.format(number) for number in range(self.version + 1, version + 1)]
+        changes = default_cache.get_many(keys)
+        if len(changes) < len(keys):
+            return False
+        for key in keys:
+            self._change(*changes[key])
+        self.version = version
+        return True
+
+    def refresh(self):
+        now = time.monotonic()
+        if self.posts is not None and now - self.checked_at < settings.SUGGEST_CHECK_INTERVAL:
+            return
+        # The generation is read before loading, so anything committed meanwhile is replayed at the next check.
+        version = cache.get_tag_versions([cache.SUGGEST_TAG])[0]
+        self.checked_at = now
+        if self.posts is None:
+            # Only the first build makes requests wait.
+            with self._build_lock:
+                if self.posts is None:
+                    self._build(version)
+            return
+        with self._lock:
+            if version == self.version or self.rebuilding or self._replay(version):
+                return
+            self.rebuilding = True
+        threading.Thread(target=self._rebuild, args=(version,), daemon=True).start()
+
+    def search(self, query: str, language: str, limit: int) -> dict[str, list[tuple[str, str]]]:
+        prefix = normalize_query(query)
+        if not prefix:
+            return {"posts": [], "tags": [], "categories": []}
+        self.refresh()
+        if language not in self.tags:
+            language = settings.MODELTRANSLATION_DEFAULT_LANGUAGE
+        return {
+            "posts": self.posts.search(prefix, limit),
+            "tags": self.tags[language].search(prefix, limit),
+            "categories": self.categories[language].search(prefix, limit),
+        }
+
+    def _change(self, kind, items):
+        """Index (pk, labels, slug) items of a kind, or drop those whose labels are None."""
+        indexes = {None: self.posts} if kind == "posts" else getattr(self, kind)
+        for language, index in indexes.items():
+            for pk, labels, slug in items:
+                if labels is None:
+                    index.remove(pk)
+                else:
+                    index.add(pk, labels if language is None else labels[language], slug)
+
+    def _apply(self, change):
+        with self._lock:
+            version = cache.bump_tag(cache.SUGGEST_TAG)
+            if version is not None:
+                default_cache.set(CHANGE_KEY.format(version), change, settings.SUGGEST_CHANGE_TIMEOUT)
+            if self.posts is None:
+                return
+            self._change(*change)
+            # Keep the generation only if no other process changed anything since; otherwise the next check replays.
+            if version is not None and self.version is not None and version == self.version + 1:
+                self.version = version
+
+    def _on_commit(self, kind, items):
+        transaction.on_commit(lambda: self._apply((kind, items)))
+
+    def post_changed(self, pk, title=None, slug=None):
+        """Index a published post, or drop it when title is None."""
+        self.posts_changed([(pk, title, slug)])
+
+    def posts_changed(self, items):
+        self._on_commit("posts", list(items))
+
+    def tag_changed(self, tag, deleted=False):
+        self._on_commit("tags", [(tag.pk, None if deleted else get_translated_labels(tag, "tag"), tag.slug)])
+
+    def category_changed(self, category, deleted=False):
+        self._on_commit("categories", [(category.pk, None if deleted else get_translated_labels(category, "name"),
+                                        category.slug)])
+
+
+suggest_index = SuggestIndex()
@@ -1,32 +1,55 @@
+import datetime
+import logging
+
 from django.apps import apps
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.mail import send_mail
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.template import Template, Context
 from django.utils import timezone
-import fasttext
-from googletrans import Translator
+from celery.signals import worker_init, worker_process_init
 
 from sitewomen.celery import app
-from women.models import Women, PageVisit
+from women.models import Women, PageVisitFlush, PostViewDaily, PostVisitors
+from women.counters import reconcile
+from women.pageviews import flush_views, get_visitors
+from women.partitions import apply_retention, ensure_partitions
+from women import covisitation, dispatch, langid, related, related_content, segments
+
+logger = logging.getLogger(__name__)
 
 
 REPORT_TEMPLATE = """   
-                        {% load women_tags %}
                         Here's how you did till now: 
                         {% for post in posts %}
-                            {% get_page_count_views post.slug as count %}
-                            "{{ post.title }}": viewed {{ count }} times | 
+                            "{{ post.title }}": viewed {{ post.views_today }} times by about {{ post.visitors_today }} visitors | 
                         {% endfor %} 
                     """
 
 
+@worker_init.connect
+def preload_language_model(**kwargs):
+    # Loaded before the pool forks, so the children share it instead of loading it for every task.
+    langid.get_model()
+
+
+@worker_process_init.connect
+def load_language_model(**kwargs):
+    langid.get_model()
+
+
 @app.task
 def send_view_count_report():
+    views_today = PostViewDaily.objects.filter(post=OuterRef("pk"), date=timezone.localdate()).values("views")
     for user in get_user_model().objects.filter(email_verified=True):
-        posts = Women.objects.filter(author=user)
+        posts = list(Women.objects.filter(author=user).annotate(views_today=Coalesce(Subquery(views_today), 0)))
         if not posts:
             continue
+        visitors = get_visitors([post.pk for post in posts], PostVisitors.Period.DAY)
+        for post in posts:
+            post.visitors_today = visitors.get(post.pk, 0)
         template = Template(REPORT_TEMPLATE)
         send_mail(
             'Your Django_celery Project Activity',
@@ -39,48 +62,71 @@ def send_view_count_report():
 
 @app.task
 def delete_old_posts():
-    now = timezone.localtime(timezone.now())
-    PageVisit.objects.filter(visit_time__lt=now).delete()
+    ensure_partitions()
+    apply_retention()
+    # Weeks and months are kept; days are only needed while they can still be shown.
+    PostVisitors.objects.filter(period=PostVisitors.Period.DAY,
+                                start__lt=timezone.localdate() - datetime.timedelta(days=31)).delete()
+
+
+@app.task
+def flush_page_views():
+    today = timezone.localdate()
+    yesterday = today - datetime.timedelta(days=1)
+    # Views counted just before midnight are still buffered under yesterday's date.
+    for date in (yesterday, today):
+        flush_views(date)
+    PageVisitFlush.objects.filter(date__lt=yesterday).delete()
+
+
+@app.task
+def update_related_posts(post_ids, tag_ids):
+    related.update_related_posts(related.get_affected_posts(post_ids, tag_ids))
+
+
+@app.task
+def update_content_neighbours(post_ids):
+    related_content.update_posts(post_ids)
 
 
 @app.task
-def translate_model_content(model_name: str, field_name: str, pk: int) -> None:
-    model = fasttext.load_model("fasttext_models/lid.176.bin")
-    translator = Translator()
+def build_covisitation():
+    return covisitation.build()
+
 
+@app.task
+def reconcile_counters():
+    reconcile()
+
+
+@app.task
+def translate_model_content(model_name: str, field_name: str, pk: int, version: int | None = None) -> None:
+    if not dispatch.is_latest(model_name, field_name, pk, version):
+        return
     Model = apps.get_model("women", model_name)
-    obj = Model.objects.get(pk=pk)
+    obj = Model.objects.filter(pk=pk).first()
+    if obj is None:
+        # Deleted before the job ran.
+        return
     text = getattr(obj, field_name)
 
-    label, _ = model.predict(text.replace('"', '\\"').replace('\n', '\\n'), k=1)
-    language = label[0].replace('__label__', '')
-    if language == "en":
-        text_ru = translator.translate(text, src='en', dest='ru').text
-        text_be = translator.translate(text, src='en', dest='be').text
-        setattr(obj, f"{field_name}_ru", text_ru)
-        setattr(obj, f"{field_name}_be", text_be)
-    if language == "ru":
-        text_en = translator.translate(text, src='ru', dest='en').text
-        text_be = translator.translate(text, src='ru', dest='be').text
-        setattr(obj, f"{field_name}_en", text_en)
-        setattr(obj, f"{field_name}_be", text_be)
-    if language == "be":
-        text_en = translator.translate(text, src='be', dest='en').text
-        text_ru = translator.translate(text, src='be', dest='ru').text
-        setattr(obj, f"{field_name}_en", text_en)
-        setattr(obj, f"{field_name}_ru", text_ru)
-
+    language = langid.detect_language(text)
     if language == "zh":
         language = "zh-tw"
 
-    try:
-        text_en = translator.translate(text, src=language, dest='en').text
-        text_ru = translator.translate(text, src=language, dest='ru').text
-        text_be = translator.translate(text, src=language, dest='be').text
-        setattr(obj, f"{field_name}_en", text_en)
-        setattr(obj, f"{field_name}_ru", text_ru)
-        setattr(obj, f"{field_name}_be", text_be)
-    except:
-        print("Данный язык для перевода не поддерживается")
-
-    obj.save()
\ No newline at end of file
+    translations, errors = segments.translate(text, language)
+    if language in settings.MODELTRANSLATION_LANGUAGES:
+        translations[language] = text
+    for error in errors:
+        logger.warning("Could not translate %s.%s of %s from %s", model_name, field_name, pk, language,
+                       exc_info=error)
+    if not dispatch.is_latest(model_name, field_name, pk, version):
+        return
+    for code, translation in translations.items():
+        setattr(obj, f"{field_name}_{code}", translation)
+
+    # Only the translations, so that an edit saved meanwhile is not overwritten.
+    obj.save(update_fields=[f"{field_name}_{code}" for code in translations])
+    if model_name == "Women":
+        # The other languages' content only exists now.
+        update_content_neighbours.delay([pk])
\ No newline at end of file
@@ -1,10 +1,14 @@
 from django import template
+from django.conf import settings
 from django.db.models import Count
 from django.urls import reverse
 from django.utils import translation
 from django.utils import timezone
 
-from women.models import TagPost, Women, Category, PageVisit
+from women.comment_tree import render_comments
+from women.models import TagPost, Women, Category, PostViewDaily, Rating
+from women.pageviews import get_post_visitors
+from women.trending import get_trending
 
 register = template.Library()
 
@@ -22,14 +26,30 @@ def show_tags():
     return {"tags": tags}
 
 
-@register.inclusion_tag("women/users_rating.html")
-def show_users_rating(post, ip):
-    rating = post.ratings.filter(ip_address=ip)
-    if rating:
-        value = rating[0].value
+@register.inclusion_tag("women/list_trending.html")
+def show_trending(limit=settings.TRENDING_LIMIT):
+    return {"posts": get_trending(limit)}
+
+
+@register.inclusion_tag("women/users_rating.html", takes_context=True)
+def show_users_rating(context, post, ip):
+    # Views built on DataMixin load the votes of every post on the page at once.
+    if isinstance(post, dict):
+        # A post card of a listing.
+        post_id, rating = post["id"], post["likes"] - post["dislikes"]
     else:
-        value = None
-    return {"value": value, "p": post}
+        post_id, rating = post.pk, post.get_sum_rating()
+    votes = context.get("user_votes")
+    if votes is not None:
+        value = votes.get(post_id)
+    else:
+        value = Rating.objects.filter(post_id=post_id, ip_address=ip).values_list("value", flat=True).first()
+    return {"value": value, "post_id": post_id, "rating": rating}
+
+
+@register.simple_tag(takes_context=True)
+def show_comments(context, post):
+    return render_comments(post, context["request"].user)
 
 
 @register.simple_tag
@@ -58,8 +78,11 @@ def change_language_url(request, language_code):
 
 
 @register.simple_tag
-def get_page_count_views(url):
-    now = timezone.localtime(timezone.now()).day
-    pages = PageVisit.objects.filter(url=url, visit_time__day=now).aggregate(
-                                    count=Count("visit_time__day"))
-    return pages["count"]
\ No newline at end of file
+def get_page_count_views(post):
+    today = timezone.localdate()
+    return PostViewDaily.objects.filter(post=post, date=today).values_list("views", flat=True).first() or 0
+
+
+@register.simple_tag
+def get_unique_visitors(post):
+    return get_post_visitors(post.pk)
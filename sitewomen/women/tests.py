@@ -1,22 +1,57 @@
+import datetime
+import os
+import tempfile
+import time
+import unittest
 from http import HTTPStatus
+from io import StringIO
 from unittest.mock import patch
 
-from django.test import TestCase
+import redis
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache as default_cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse, resolve
-from django.utils import translation
+from django.utils import timezone, translation
 
 from .forms import ContactForm
-from .models import Women, Category
-from . import views
-from .views import HomePage
+from .models import (Women, Category, TagPost, PageVisit, PageVisitFlush, PostViewDaily, Rating, Comment,
+                     RelatedPost, TrendingScore, TranslationMemory)
+from .counters import add_views, reconcile
+from .pageviews import flush_views
+from .templatetags.women_tags import get_page_count_views
+from .paginators import CountingPaginator, KeysetPaginator
+from .suggest import SuggestIndex, suggest_index
+from .tasks import translate_model_content, update_related_posts
+from . import (cache, comment_tree, covisitation, dispatch, hll, langid, pageviews, partitions, related_content,
+               segments, translation_memory, translators, trending, views)
+from .utils import SearchFieldMixin
+from .views import HomePage, ShowPost
 from sitewomen.settings import LANGUAGES
 
 
+def setUpModule():
+    # There is no broker in tests, so the similar posts by tags are recomputed right away.
+    # Content vectors live in files and are only touched by ContentNeighbourTests.
+    for patcher in (patch("women.tasks.update_related_posts.delay", side_effect=update_related_posts),
+                    patch("women.tasks.update_content_neighbours.delay")):
+        patcher.start()
+        unittest.addModuleCleanup(patcher.stop)
+
+
 class WomenViewsTests(TestCase):
     fixtures = ['women_women.json', 'women_category.json', 'women_tagspost.json',
                 "users_perms.json", "users_authors.json", "users_groups.json"]
 
     def setUp(self):
+        default_cache.clear()
         self.home_path = reverse("home")
         self.home_response = self.client.get(self.home_path)
         self.all_posts = Women.published.select_related("cat", "author")
@@ -28,8 +63,8 @@ class WomenViewsTests(TestCase):
 
         while page <= num_pages:
             response = self.client.get(f"{self.home_path}?page={page}")
-            self.assertQuerySetEqual(response.context_data["posts"],
-                            self.all_posts[(page - 1) * paginate_by: page * paginate_by])
+            self.assertQuerySetEqual(self.all_posts[(page - 1) * paginate_by: page * paginate_by],
+                                     [p["id"] for p in response.context_data["posts"]], transform=lambda p: p.pk)
             page += 1
 
     def test_detail_post(self):
@@ -213,4 +248,1146 @@ class CategoryModelTests(TestCase):
         first_cat = saved_cats[0]
         second_cat = saved_cats[1]
         self.assertEqual(first_cat.name, 'Актрисы')
-        self.assertIsInstance(second_cat.parent, Category)
\ No newline at end of file
+        self.assertIsInstance(second_cat.parent, Category)
+
+
+class TaggedCacheTests(TestCase):
+    def setUp(self):
+        default_cache.clear()
+        self.parent = Category.objects.create(name="Знаменитости")
+        self.child = Category.objects.create(name="Актрисы кино", parent=self.parent)
+        self.tag = TagPost.objects.create(tag="Кино")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post = Women.objects.create(title="Тестовая статья", content="Биография", cat=self.child)
+
+    def test_entry_is_reused_until_tag_changes(self):
+        calls = []
+        cache.get_or_set("test_key", lambda: calls.append(1) or len(calls), tags=[cache.POSTS_TAG])
+        self.assertEqual(cache.get_or_set("test_key", 0, tags=[cache.POSTS_TAG]), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.save()
+        cache.get_or_set("test_key", lambda: calls.append(1) or len(calls), tags=[cache.POSTS_TAG])
+        self.assertEqual(len(calls), 2)
+
+    def test_post_save_invalidates_category_ancestors(self):
+        key = cache.make_tagged_key("test_key", [cache.category_tag(self.parent.pk)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.save()
+        self.assertNotEqual(key, cache.make_tagged_key("test_key", [cache.category_tag(self.parent.pk)]))
+
+    def test_queryset_update_invalidates(self):
+        key = cache.make_tagged_key("test_key", [cache.category_tag(self.child.pk)])
+        with self.captureOnCommitCallbacks(execute=True):
+            Women.objects.filter(pk=self.post.pk).update(is_published=Women.Status.DRAFT)
+        self.assertNotEqual(key, cache.make_tagged_key("test_key", [cache.category_tag(self.child.pk)]))
+
+    def test_tags_m2m_change_invalidates(self):
+        key = cache.make_tagged_key("test_key", [cache.tag_tag(self.tag.pk)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.tags.add(self.tag)
+        self.assertNotEqual(key, cache.make_tagged_key("test_key", [cache.tag_tag(self.tag.pk)]))
+        key = cache.make_tagged_key("test_key", [cache.tag_tag(self.tag.pk)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.tags.clear()
+        self.assertNotEqual(key, cache.make_tagged_key("test_key", [cache.tag_tag(self.tag.pk)]))
+
+    def test_unrelated_tag_is_untouched(self):
+        other = TagPost.objects.create(tag="Музыка")
+        key = cache.make_tagged_key("test_key", [cache.tag_tag(other.pk)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.tags.add(self.tag)
+        self.assertEqual(key, cache.make_tagged_key("test_key", [cache.tag_tag(other.pk)]))
+
+
+
+class ListingCacheTests(TestCase):
+    fixtures = ["some_women_posts.json", "women_category.json"]
+
+    def setUp(self):
+        default_cache.clear()
+        self.path = reverse("home")
+
+    @staticmethod
+    def post_queries(queries):
+        return [q["sql"] for q in queries if 'FROM "women_women" ' in q["sql"]]
+
+    def test_cached_page_does_not_query_posts(self):
+        first = self.client.get(self.path)
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(self.path)
+        self.assertEqual(self.post_queries(ctx.captured_queries), [])
+        self.assertEqual([p["id"] for p in first.context_data["posts"]],
+                         [p["id"] for p in second.context_data["posts"]])
+        self.assertEqual(second.context_data["paginator"].count, Women.published.count())
+
+    def test_publish_change_refreshes_page(self):
+        self.client.get(self.path)
+        with self.captureOnCommitCallbacks(execute=True):
+            Women.objects.filter(pk=1).update(is_published=Women.Status.DRAFT)
+        response = self.client.get(self.path)
+        self.assertNotIn(1, [p["id"] for p in response.context_data["posts"]])
+
+    def test_cached_page_shows_current_counters(self):
+        self.client.get(self.path)
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.objects.create(post_id=1, value=1, ip_address="10.0.0.1")
+        response = self.client.get(self.path)
+        post = next(p for p in response.context_data["posts"] if p["id"] == 1)
+        self.assertEqual(post["likes"] - post["dislikes"], 1)
+
+    def test_pages_cache_plain_cards(self):
+        response = self.client.get(self.path)
+        card = response.context_data["posts"][0]
+        self.assertIs(type(card), dict)
+        post = Women.objects.get(pk=card["id"])
+        self.assertEqual((card["title"], card["url"]), (post.title, post.get_absolute_url()))
+        self.assertContains(response, f'href="{card["url"]}"')
+        self.assertContains(response, f'src="{card["thumbnail_url"]}"')
+
+
+
+class KeysetPaginationTests(TestCase):
+    fixtures = ["women_cat.json"]
+
+    def setUp(self):
+        default_cache.clear()
+        for i in range(7):
+            Women.objects.create(title=f"Тестовая статья {i}", content="Биография", cat_id=1)
+        # Rows sharing a timestamp must still be ordered and paged deterministically by id.
+        Women.objects.filter(title__in=["Тестовая статья 2", "Тестовая статья 3"]).update(
+            time_create=Women.objects.get(title="Тестовая статья 4").time_create)
+        self.ordered = list(Women.published.order_by("-time_create", "-id").values_list("pk", flat=True))
+
+    def test_walk_forward_and_back(self):
+        paginator = KeysetPaginator(Women.published.all(), 3)
+        page = paginator.page()
+        pages = [[p.pk for p in page]]
+        while page.has_next():
+            page = paginator.page(page.next_cursor)
+            pages.append([p.pk for p in page])
+        self.assertEqual(sum(pages, []), self.ordered)
+        self.assertFalse(paginator.page().has_previous())
+
+        while page.has_previous():
+            page = paginator.page(page.previous_cursor)
+            self.assertEqual([p.pk for p in page], pages[-2])
+            pages.pop()
+
+    def test_cursor_listing_view(self):
+        response = self.client.get(reverse("home"), {"cursor": ""})
+        self.assertEqual([p["id"] for p in response.context_data["posts"]], self.ordered[:HomePage.paginate_by])
+        next_cursor = response.context_data["page_obj"].next_cursor
+        response = self.client.get(reverse("home"), {"cursor": next_cursor}, HTTP_HX_REQUEST="true")
+        self.assertTemplateUsed(response, "women/content.html")
+        self.assertEqual([p["id"] for p in response.context_data["posts"]], self.ordered[HomePage.paginate_by:])
+
+    def test_tampered_cursor(self):
+        response = self.client.get(reverse("home"), {"cursor": "bogus"})
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+
+class CountingPaginatorTests(TestCase):
+    fixtures = ["some_women_posts.json", "women_category.json"]
+
+    def setUp(self):
+        default_cache.clear()
+
+    def test_count_is_shared_between_paginators(self):
+        self.assertEqual(CountingPaginator(Women.published.all(), 2).count, 3)
+        with self.assertNumQueries(0):
+            paginator = CountingPaginator(Women.published.all(), 2)
+            self.assertEqual(paginator.count, 3)
+        self.assertFalse(paginator.is_estimated)
+
+    def test_count_follows_publish_changes(self):
+        tags = [cache.POSTS_TAG]
+        self.assertEqual(CountingPaginator(Women.published.all(), 2, cache_tags=tags).count, 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Women.objects.filter(pk=1).update(is_published=Women.Status.DRAFT)
+        self.assertEqual(CountingPaginator(Women.published.all(), 2, cache_tags=tags).count, 2)
+
+    def count_queries(self, tags):
+        cache.bump_tag(cache.POSTS_TAG)
+        with CaptureQueriesContext(connection) as ctx:
+            paginator = CountingPaginator(Women.published.all(), 2, cache_tags=tags)
+            paginator.count
+        return paginator, [q["sql"] for q in ctx.captured_queries]
+
+    def test_small_results_are_not_explained(self):
+        tags = [cache.POSTS_TAG]
+        for _ in range(2):
+            paginator, queries = self.count_queries(tags)
+            self.assertEqual(paginator.count, 3)
+            self.assertFalse(any(sql.startswith("EXPLAIN") for sql in queries))
+
+    @override_settings(PAGINATOR_ESTIMATE_THRESHOLD=1)
+    def test_large_results_use_planner_estimate(self):
+        tags = [cache.POSTS_TAG]
+        paginator, _ = self.count_queries(tags)
+        self.assertEqual(paginator.count, 3)
+        self.assertFalse(paginator.is_estimated)
+
+        paginator, queries = self.count_queries(tags)
+        self.assertGreater(paginator.count, 0)
+        self.assertTrue(paginator.is_estimated)
+        self.assertTrue(queries[-1].startswith("EXPLAIN"))
+
+
+
+class PostSearchTests(TestCase):
+    fixtures = ["women_cat.json"]
+
+    def setUp(self):
+        default_cache.clear()
+        self.actress = Women.objects.create(title="Анджелина Джоли", cat_id=1,
+                                            content_ru="<p>Американская актриса кино</p>",
+                                            content_en="<p>American film actress</p>")
+        self.singer = Women.objects.create(title="Марго Робби", cat_id=1,
+                                           content_ru="<p>Певица и автор песен</p>",
+                                           content_en="<p>Singer and songwriter</p>")
+
+    def search(self, language, query):
+        with translation.override(language):
+            queryset = HomePage.calculate_similarity(query, Women.published.all())
+            return [post.pk for post in queryset]
+
+    def test_vectors_are_stored_on_save(self):
+        post = Women.objects.get(pk=self.actress.pk)
+        self.assertIn("actress", post.search_vector_en)
+        self.assertIn("актрис", post.search_vector_ru)
+
+    def test_fixtures_do_not_update_vectors(self):
+        with self.assertNumQueries(0):
+            post_save.send(Women, instance=self.actress, created=False, raw=True, using="default", update_fields=None)
+
+    def test_search_uses_language_stemming(self):
+        self.assertEqual(self.search("ru", "актрисы"), [self.actress.pk])
+        self.assertEqual(self.search("en", "actresses"), [self.actress.pk])
+
+    def search_queries(self, language, query):
+        with translation.override(language), CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("home"), {"query": query})
+        return response, [q["sql"] for q in ctx.captured_queries if "search_vector" in q["sql"]]
+
+    def test_search_results_are_cached_by_normalized_query(self):
+        response, queries = self.search_queries("ru", "актрисы")
+        self.assertTrue(queries)
+        self.assertEqual([p["id"] for p in response.context_data["posts"]], [self.actress.pk])
+        response, queries = self.search_queries("ru", "  АКТРИСЫ ")
+        self.assertEqual(queries, [])
+        self.assertEqual(response.context_data["paginator"].count, 1)
+
+    def test_search_cache_follows_post_changes(self):
+        self.search_queries("ru", "актрисы")
+        with self.captureOnCommitCallbacks(execute=True):
+            Women.objects.create(title="Одри Хепберн", cat_id=1, content_ru="<p>Британская актриса</p>")
+        response, queries = self.search_queries("ru", "актрисы")
+        self.assertTrue(queries)
+        self.assertEqual(response.context_data["paginator"].count, 2)
+
+    def test_category_search_ignores_other_categories(self):
+        with translation.override("ru"):
+            path = reverse("category", args=("aktrisy",))
+            self.client.get(path, {"query": "актрисы"})
+            other = Category.objects.create(name="Спортсменки", slug="sport")
+            with self.captureOnCommitCallbacks(execute=True):
+                Women.objects.create(title="Гимнастка Кабаева", cat=other, content_ru="<p>Спортсменка и актриса</p>")
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(path, {"query": "актрисы"})
+        self.assertFalse([q for q in ctx.captured_queries if "search_vector" in q["sql"]])
+
+    def test_concurrent_miss_waits_for_first_caller(self):
+        key = cache.make_tagged_key("search_test", [cache.POSTS_TAG])
+        default_cache.add(f"{key}:lock", 1)
+        computed = []
+
+        def other_caller_finishes(seconds):
+            default_cache.set(key, [42])
+
+        with patch("women.cache.time.sleep", side_effect=other_caller_finishes):
+            value = cache.get_or_set_once("search_test", lambda: computed.append(1) or [0], tags=[cache.POSTS_TAG])
+        self.assertEqual(value, [42])
+        self.assertEqual(computed, [])
+
+    def test_title_is_ranked_above_content(self):
+        cher = Women.objects.create(title="Певица Шер", cat_id=1, content_ru="<p>Биография</p>")
+        results = self.search("ru", "певица")
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0], cher.pk)
+
+    def test_search_works_without_listing_cache(self):
+        view = SearchFieldMixin()
+        view.request = RequestFactory().get(reverse("home"), {"query": "актрисы"})
+        view.request.resolver_match = resolve(reverse("home"))
+        with translation.override("ru"):
+            results = view.get_search_results(Women.published.all())
+        self.assertEqual(results, [self.actress.pk])
+
+
+class SuggestTests(TestCase):
+    fixtures = ["women_cat.json"]
+
+    def setUp(self):
+        default_cache.clear()
+        suggest_index.clear()
+        self.post = Women.objects.create(title="Анджелина Джоли", cat_id=1)
+        TagPost.objects.create(tag_en="Actress", tag_ru="Актриса")
+
+    def suggest(self, query, language="ru"):
+        with translation.override(language):
+            return self.client.get(reverse("suggest"), {"q": query}).json()
+
+    def labels(self, query, kind="posts", language="ru"):
+        return [item["label"] for item in self.suggest(query, language)[kind]]
+
+    def test_suggest_matches_every_word_of_a_title(self):
+        data = self.suggest(" ДЖО")
+        with translation.override("ru"):
+            url = reverse("post", args=(self.post.slug,))
+        self.assertEqual(data["posts"], [{"label": "Анджелина Джоли", "url": url}])
+        self.assertEqual(self.labels("анджелина д"), ["Анджелина Джоли"])
+        self.assertEqual(self.labels("ли"), [])
+
+    def test_suggest_tags_per_language(self):
+        self.assertEqual(self.labels("акт", "tags", "ru"), ["Актриса"])
+        self.assertEqual(self.labels("act", "tags", "en"), ["Actress"])
+        self.assertEqual(self.labels("акт", "tags", "en"), [])
+
+    def test_built_index_does_not_query_database(self):
+        self.suggest("дж")
+        with self.assertNumQueries(0):
+            self.suggest("анд")
+
+    def test_index_is_updated_in_place(self):
+        self.suggest("дж")
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Women.objects.create(title="Джулия Робертс", cat_id=1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels("дж"), ["Анджелина Джоли", "Джулия Робертс"])
+
+        post.is_published = Women.Status.DRAFT
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save()
+        self.assertEqual(self.labels("дж"), ["Анджелина Джоли"])
+
+    def test_unrelated_changes_keep_the_index(self):
+        self.suggest("дж")
+        version = cache.get_tag_versions([cache.SUGGEST_TAG])
+        self.post.content = "<p>Актриса</p>"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.save()
+            self.post.save(update_fields=["content"])
+            Women.objects.filter(pk=self.post.pk).update(content="<p>Режиссёр</p>")
+        self.assertEqual(cache.get_tag_versions([cache.SUGGEST_TAG]), version)
+
+    @override_settings(SUGGEST_CHECK_INTERVAL=0)
+    def test_changes_elsewhere_are_replayed(self):
+        other = SuggestIndex()
+        other.refresh()
+        with self.captureOnCommitCallbacks(execute=True):
+            Women.objects.filter(pk=self.post.pk).update(title="Анджелина Войт")
+            TagPost.objects.create(tag_en="Singer", tag_ru="Певица")
+        with self.assertNumQueries(0):
+            self.assertEqual(other.search("дж", "ru", 8)["posts"], [])
+            self.assertEqual(other.search("во", "ru", 8)["posts"], [("Анджелина Войт", self.post.slug)])
+            self.assertEqual([label for label, _ in other.search("si", "en", 8)["tags"]], ["Singer"])
+
+    @override_settings(SUGGEST_CHECK_INTERVAL=0)
+    def test_lost_changes_rebuild_in_background(self):
+        self.suggest("дж")
+        Women.objects.filter(pk=self.post.pk).update(title="Анджелина Войт")
+        version = cache.bump_tag(cache.SUGGEST_TAG)
+        with patch("women.suggest.threading.Thread") as thread, self.assertNumQueries(0):
+            self.assertEqual(self.labels("дж"), ["Анджелина Джоли"])
+            self.assertEqual(self.labels("дж"), ["Анджелина Джоли"])
+        thread.assert_called_once()
+        self.assertEqual(thread.call_args.kwargs["args"], (version,))
+
+        suggest_index._build(version)
+        suggest_index.rebuilding = False
+        self.assertEqual(self.labels("во"), ["Анджелина Войт"])
+
+
+def clear_visits():
+    client = pageviews.get_redis()
+    keys = list(client.scan_iter("pageviews:*"))
+    if keys:
+        client.delete(*keys)
+
+
+class PageViewTests(TestCase):
+    fixtures = ["women_cat.json"]
+    user_agent = "Mozilla/5.0 (X11; Linux x86_64) Firefox/120.0"
+    visitor = "0123456789abcdef0123456789abcdef"
+
+    def setUp(self):
+        default_cache.clear()
+        clear_visits()
+        self.post = Women.objects.create(title="Анджелина Джоли", cat_id=1)
+
+    def flush(self):
+        # The flushed visits leave the buffer when the transaction commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            return flush_views(timezone.localdate())
+
+    def view(self, slug, user_agent=None, visitor=None):
+        request = RequestFactory().get("/", HTTP_USER_AGENT=user_agent or self.user_agent)
+        if visitor:
+            request.COOKIES[settings.VISITOR_COOKIE_NAME] = visitor
+        view = ShowPost()
+        view.setup(request, post_slug=slug)
+        return view.get_object()
+
+    def test_views_are_buffered_until_flush(self):
+        with self.assertNumQueries(1):
+            self.view(self.post.slug)
+        self.view(self.post.slug)
+        self.assertFalse(PageVisit.objects.exists())
+
+        self.assertEqual(self.flush(), 2)
+        self.assertEqual(PageVisit.objects.filter(url=self.post.slug).count(), 2)
+
+    def test_visits_are_buffered_in_lists(self):
+        for _ in range(3):
+            self.view(self.post.slug, visitor=self.visitor)
+        client = pageviews.get_redis()
+        self.assertEqual(len(list(client.scan_iter("pageviews:*"))), 1)
+        self.assertEqual(self.flush(), 3)
+        self.assertEqual(list(client.scan_iter("pageviews:*")), [])
+
+    def test_views_are_counted_without_redis(self):
+        with patch("women.pageviews.get_redis", side_effect=redis.ConnectionError), \
+                self.assertLogs("women.pageviews", "WARNING"):
+            self.view(self.post.slug, visitor=self.visitor)
+        self.assertEqual(self.flush(), 1)
+        self.assertEqual(PageVisit.objects.count(), 0)
+
+    def test_visits_of_a_failed_flush_are_read_again(self):
+        self.view(self.post.slug, visitor=self.visitor)
+        with transaction.atomic():
+            self.assertEqual(len(pageviews.get_new_visits(timezone.localdate())), 1)
+            transaction.set_rollback(True)
+        self.view(self.post.slug, visitor=self.visitor)
+        # The visits left by the failed flush come first, the new ones with the next flush.
+        self.flush()
+        self.assertEqual(PageVisit.objects.count(), 1)
+        self.flush()
+        self.assertEqual(PageVisit.objects.count(), 2)
+
+    def test_repeated_flush_does_not_count_twice(self):
+        self.view(self.post.slug)
+        self.flush()
+        self.assertEqual(self.flush(), 0)
+        self.view(self.post.slug)
+        self.assertEqual(self.flush(), 1)
+        self.assertEqual(PageVisit.objects.count(), 2)
+        self.assertEqual(PageVisitFlush.objects.get(url=self.post.slug).views, 2)
+
+    def test_restarted_counter_is_counted_in_full(self):
+        self.view(self.post.slug)
+        self.view(self.post.slug)
+        self.flush()
+        # Evicted, then counted again past the stored mark.
+        default_cache.delete(pageviews.COUNTER_KEY.format(date=timezone.localdate().isoformat(), url=self.post.slug))
+        for _ in range(3):
+            self.view(self.post.slug)
+        self.assertEqual(self.flush(), 3)
+        self.assertEqual(self.flush(), 0)
+        self.assertEqual(get_page_count_views(self.post), 5)
+
+    def test_missing_posts_and_bots_are_not_counted(self):
+        with self.assertRaises(Http404):
+            self.view("missing-post")
+        self.view(self.post.slug, user_agent="Googlebot/2.1 (+http://www.google.com/bot.html)")
+        self.assertEqual(self.flush(), 0)
+
+    def test_flush_adds_to_daily_totals(self):
+        self.view(self.post.slug)
+        self.flush()
+        self.view(self.post.slug)
+        self.view(self.post.slug)
+        self.flush()
+        with self.assertNumQueries(1):
+            self.assertEqual(get_page_count_views(self.post), 3)
+
+    def test_visits_keep_visitor(self):
+        visitor = "0123456789abcdef0123456789abcdef"
+        self.view(self.post.slug, visitor=visitor)
+        self.view(self.post.slug, visitor="not-an-id")
+        self.flush()
+        session_ids = list(PageVisit.objects.order_by("visit_time").values_list("session_id", flat=True))
+        self.assertEqual(session_ids[0], visitor)
+        self.assertRegex(session_ids[1], r"^[0-9a-f]{32}$")
+        self.assertNotEqual(session_ids[1], visitor)
+
+    def test_post_page_sets_visitor_cookie_once(self):
+        response = self.client.get(self.post.get_absolute_url(), HTTP_USER_AGENT=self.user_agent)
+        visitor = response.cookies[settings.VISITOR_COOKIE_NAME].value
+        response = self.client.get(self.post.get_absolute_url(), HTTP_USER_AGENT=self.user_agent)
+        self.assertNotIn(settings.VISITOR_COOKIE_NAME, response.cookies)
+        self.flush()
+        self.assertEqual(list(PageVisit.objects.values_list("session_id", flat=True)), [visitor, visitor])
+
+    @override_settings(PAGEVIEW_STORE_VISITS=False)
+    def test_raw_visits_are_optional(self):
+        self.view(self.post.slug)
+        self.flush()
+        self.assertFalse(PageVisit.objects.exists())
+        self.assertEqual(get_page_count_views(self.post), 1)
+
+    def test_backfill_aggregates_raw_visits(self):
+        day = timezone.localdate() - datetime.timedelta(days=3)
+        visit_time = timezone.make_aware(datetime.datetime.combine(day, datetime.time(12)))
+        PageVisit.objects.bulk_create([PageVisit(url=self.post.slug, visit_time=visit_time) for _ in range(3)] +
+                                      [PageVisit(url="missing-post", visit_time=visit_time)])
+        call_command("backfill_post_views", stdout=StringIO())
+        call_command("backfill_post_views", stdout=StringIO())
+        self.assertQuerySetEqual(PostViewDaily.objects.values_list("post_id", "date", "views"),
+                                 [(self.post.pk, day, 3)])
+
+
+class PageVisitRetentionTests(TestCase):
+    def visit_on(self, day, url):
+        return PageVisit(url=url, visit_time=timezone.make_aware(datetime.datetime.combine(day, datetime.time(12))))
+
+    def test_table_is_partitioned_ahead(self):
+        self.assertTrue(partitions.is_partitioned())
+        partitions.ensure_partitions()
+        today = timezone.localdate()
+        self.assertIn(today + datetime.timedelta(days=settings.PAGEVIEW_PARTITIONS_AHEAD), partitions.get_partitions())
+
+    @override_settings(PAGEVIEW_RETENTION_DAYS=30)
+    def test_old_days_are_dropped(self):
+        today = timezone.localdate()
+        old_day = today - datetime.timedelta(days=40)
+        partitions.create_partitions(old_day, old_day)
+        # A day without its own partition ends up in the default partition.
+        PageVisit.objects.bulk_create([self.visit_on(old_day, "old"),
+                                       self.visit_on(old_day - datetime.timedelta(days=1), "older"),
+                                       self.visit_on(today, "new")])
+
+        partitions.apply_retention()
+        self.assertEqual(list(PageVisit.objects.values_list("url", flat=True)), ["new"])
+        self.assertNotIn(old_day, partitions.get_partitions())
+
+
+class CounterTests(TestCase):
+    fixtures = ["women_cat.json"]
+
+    def setUp(self):
+        default_cache.clear()
+        self.post = Women.objects.create(title="Анджелина Джоли", cat_id=1)
+        self.user = get_user_model().objects.create_user(username="reader", password="password")
+
+    def counters(self):
+        return Women.objects.values_list(*Women.COUNTER_FIELDS).get(pk=self.post.pk)
+
+    def vote(self, value):
+        return self.client.post(reverse("rating"), {"post_id": self.post.pk, "value": value}).json()
+
+    def test_votes_update_counters(self):
+        self.assertEqual(self.vote(1)["rating_sum"], 1)
+        self.assertEqual(self.vote(-1)["rating_sum"], -1)
+        self.assertEqual(self.counters(), (0, 1, 0, 0))
+        self.assertEqual(self.vote(-1)["rating_sum"], 0)
+        self.assertEqual(self.counters(), (0, 0, 0, 0))
+
+    def test_only_active_top_level_comments_are_counted(self):
+        comment = Comment.objects.create(post=self.post, author=self.user, body="Первый")
+        Comment.objects.create(post=self.post, author=self.user, body="Ответ", parent=comment)
+        self.assertEqual(self.counters()[2], 1)
+        comment.active = False
+        comment.save()
+        self.assertEqual(self.counters()[2], 0)
+        Comment.objects.create(post=self.post, author=self.user, body="Второй").delete()
+        self.assertEqual(self.counters()[2], 0)
+
+    def test_saving_stale_post_keeps_counters(self):
+        stale = Women.objects.get(pk=self.post.pk)
+        Rating.objects.create(post=self.post, value=1, ip_address="10.0.0.1")
+        stale.title = "Анджелина Джоли-Питт"
+        stale.save(update_fields=stale.get_edit_fields())
+        self.assertEqual(self.counters(), (1, 0, 0, 0))
+
+    def test_save_writes_every_column(self):
+        post = Women.objects.get(pk=self.post.pk)
+        Women.objects.filter(pk=post.pk).delete()
+        post.save()
+        self.assertEqual(self.counters(), (0, 0, 0, 0))
+
+    def test_reconcile_repairs_drift(self):
+        Rating.objects.create(post=self.post, value=1, ip_address="10.0.0.1")
+        Women.objects.filter(pk=self.post.pk).increment(likes=4, comments_count=2)
+        self.assertEqual(reconcile(), [self.post.pk])
+        self.assertEqual(self.counters(), (1, 0, 0, 0))
+        self.assertEqual(reconcile(), [])
+
+
+class VoteTests(TestCase):
+    fixtures = ["women_cat.json"]
+
+    def setUp(self):
+        default_cache.clear()
+        self.post = Women.objects.create(title="Анджелина Джоли", cat_id=1)
+
+    def vote_batch(self, votes, **extra):
+        return self.client.post(reverse("rating"), {"votes": [{"post_id": post_id, "value": value}
+                                                              for post_id, value in votes]},
+                                content_type="application/json", **extra)
+
+    def test_vote_is_one_statement(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse("rating"), {"post_id": self.post.pk, "value": 1})
+        self.assertEqual(len([q for q in ctx.captured_queries if "women_rating" in q["sql"]]), 1)
+        self.assertEqual(Rating.objects.get().value, 1)
+
+    def test_batch_toggles_in_order(self):
+        results = self.vote_batch([(self.post.pk, 1), (self.post.pk, 1), (self.post.pk, -1), (self.post.pk, 1)])
+        self.assertEqual([(r["status"], r["value"], r["rating_sum"]) for r in results.json()["results"]],
+                         [("created", 1, 1), ("deleted", None, 0), ("created", -1, -1), ("updated", 1, 1)])
+        self.assertEqual(Women.objects.values_list("likes", "dislikes").get(pk=self.post.pk), (1, 0))
+
+    def test_votes_are_per_ip_address(self):
+        self.vote_batch([(self.post.pk, 1)])
+        results = self.vote_batch([(self.post.pk, 1)], REMOTE_ADDR="10.0.0.2").json()["results"]
+        self.assertEqual((results[0]["status"], results[0]["rating_sum"]), ("created", 2))
+
+    def test_invalid_votes_are_rejected(self):
+        draft = Women.objects.create(title="Черновик поста", cat_id=1, is_published=Women.Status.DRAFT)
+        self.assertEqual(self.vote_batch([(draft.pk, 1)]).json()["results"][0]["status"], "not_found")
+        self.assertEqual(self.vote_batch([(self.post.pk, 2)]).status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(self.client.post(reverse("rating"), {"post_id": "x", "value": 1}).status_code,
+                         HTTPStatus.BAD_REQUEST)
+        self.assertFalse(Rating.objects.exists())
+
+
+class UserVotesTests(TestCase):
+    fixtures = ["women_cat.json"]
+
+    def setUp(self):
+        default_cache.clear()
+        self.posts = [Women.objects.create(title=f"Известная женщина {i}", cat_id=1) for i in range(3)]
+        Rating.objects.create(post=self.posts[0], value=1, ip_address="127.0.0.1")
+        Rating.objects.create(post=self.posts[1], value=-1, ip_address="10.0.0.2")
+
+    def test_votes_of_listed_posts_are_loaded_at_once(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("home"))
+        self.assertEqual(response.context["user_votes"], {self.posts[0].pk: 1})
+        self.assertEqual(len([q for q in ctx.captured_queries if '"women_rating"' in q["sql"]]), 1)
+        self.assertContains(response, "like_click.png", count=1)
+
+    def test_post_page_uses_loaded_vote(self):
+        response = self.client.get(self.posts[0].get_absolute_url(), HTTP_USER_AGENT="Mozilla/5.0")
+        self.assertEqual(response.context["user_votes"], {self.posts[0].pk: 1})
+
+    def test_edit_page_does_not_load_votes(self):
+        self.client.force_login(get_user_model().objects.create_superuser(username="admin", password="secret"))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("edit_post", args=(self.posts[0].slug,)))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotIn("user_votes", response.context)
+        self.assertFalse([q for q in ctx.captured_queries if '"women_rating"' in q["sql"]])
+
+
+class RelatedPostsTests(TestCase):
+    fixtures = ["women_cat.json"]
+
+    def setUp(self):
+        default_cache.clear()
+        self.tags = [TagPost.objects.create(tag=f"tag{i}", slug=f"tag{i}") for i in range(3)]
+        self.posts = [Women.objects.create(title=f"Известная женщина {i}", cat_id=1) for i in range(4)]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts[0].tags.set(self.tags[:2])
+            self.posts[1].tags.set(self.tags[:2])
+            self.posts[2].tags.set(self.tags[1:])
+
+    def related(self, post):
+        return list(RelatedPost.objects.filter(post=post).values_list("related_id", "score"))
+
+    def test_scores_are_tag_overlap(self):
+        self.assertEqual(self.related(self.posts[0]), [(self.posts[1].pk, 1.0), (self.posts[2].pk, 1 / 3)])
+        self.assertEqual(self.related(self.posts[3]), [])
+
+    def test_tag_change_updates_posts_sharing_tags(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts[3].tags.add(self.tags[2])
+        self.assertEqual(self.related(self.posts[2]), [(self.posts[3].pk, 0.5), (self.posts[1].pk, 1 / 3),
+                                                       (self.posts[0].pk, 1 / 3)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tags[1].tags.clear()
+        self.assertEqual(self.related(self.posts[2]), [(self.posts[3].pk, 1.0)])
+        self.assertEqual(self.related(self.posts[0]), [(self.posts[1].pk, 1.0)])
+
+    def test_unpublished_posts_are_not_related(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Women.objects.filter(pk=self.posts[1].pk).update(is_published=Women.Status.DRAFT)
+        self.assertEqual(self.related(self.posts[0]), [(self.posts[2].pk, 1 / 3)])
+        self.assertEqual(self.related(self.posts[1]), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts[2].delete()
+        self.assertEqual(self.related(self.posts[0]), [])
+
+    def test_post_page_reads_stored_similar_posts(self):
+        response = self.client.get(self.posts[0].get_absolute_url(), HTTP_USER_AGENT="Mozilla/5.0")
+        self.assertEqual(response.context["similar_posts"], [self.posts[1], self.posts[2]])
+
+    def test_rebuild_command(self):
+        RelatedPost.objects.all().delete()
+        call_command("rebuild_related_posts", "--tags-only", stdout=StringIO())
+        self.assertEqual(self.related(self.posts[1]), [(self.posts[0].pk, 1.0), (self.posts[2].pk, 1 / 3)])
+
+
+class ContentNeighbourTests(TestCase):
+    fixtures = ["women_cat.json"]
+    texts = [
+        "<p>Актриса снималась в кино и получила премию за роль</p>",
+        "Актриса получила премию за главную роль в кино",
+        "Спортсменка выиграла олимпийскую медаль в плавании",
+        "Олимпийская чемпионка по плаванию выиграла медаль",
+    ]
+
+    def setUp(self):
+        default_cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(RELATED_CONTENT_DIR=directory.name, LANGUAGES=[("ru", "Russian")],
+                                              RELATED_POSTS_COUNT=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.posts = [Women.objects.create(title=f"Известная женщина {i}", cat_id=1, content_ru=text)
+                      for i, text in enumerate(self.texts)]
+        related_content.rebuild()
+
+    def related(self, post):
+        return list(RelatedPost.objects.filter(post=post, source=RelatedPost.Source.CONTENT, language="ru")
+                    .values_list("related_id", flat=True))
+
+    def test_neighbours_share_words(self):
+        self.assertEqual(self.related(self.posts[0])[0], self.posts[1].pk)
+        self.assertEqual(self.related(self.posts[3])[0], self.posts[2].pk)
+
+    def test_update_adds_and_removes_posts(self):
+        post = Women.objects.create(title="Известная женщина 4", cat_id=1,
+                                    content_ru="Актриса получила премию за роль в кино")
+        related_content.update_posts([post.pk])
+        self.assertEqual(self.related(post)[0], self.posts[1].pk)
+        self.assertIn(post.pk, self.related(self.posts[1]))
+
+        Women.objects.filter(pk=post.pk).update(is_published=Women.Status.DRAFT)
+        related_content.update_posts([post.pk])
+        self.assertEqual(self.related(post), [])
+        self.assertNotIn(post.pk, self.related(self.posts[1]))
+        self.assertEqual(self.related(self.posts[1])[0], self.posts[0].pk)
+
+    def test_matrix_grows_when_full(self):
+        matrix = related_content.ContentMatrix("ru")
+        matrix.open()
+        capacity = len(matrix.ids)
+        posts = Women.objects.bulk_create(Women(title=f"Новая женщина {i}", slug=f"new-{i}", cat_id=1,
+                                                content_ru=f"Текст номер {i}") for i in range(capacity))
+        related_content.update_posts([post.pk for post in posts])
+        matrix.open()
+        self.assertEqual(len(matrix.ids), capacity * 2)
+        self.assertEqual(int((matrix.ids != 0).sum()), capacity + len(self.posts))
+
+    def test_post_page_blends_tags_and_content(self):
+        tag = TagPost.objects.create(tag="Кино", slug="kino")
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.tags.set([self.posts[0], self.posts[2]])
+        with translation.override("ru"):
+            response = self.client.get(self.posts[0].get_absolute_url(), HTTP_USER_AGENT="Mozilla/5.0")
+        self.assertEqual(response.context["similar_posts"][:2], [self.posts[2], self.posts[1]])
+
+    def test_missing_matrix_is_not_built_by_updates(self):
+        matrix = related_content.ContentMatrix("ru")
+        os.remove(matrix.path("state.npz"))
+        with self.assertLogs("women.related_content", "ERROR"):
+            self.assertEqual(related_content.update_posts([self.posts[0].pk]), 0)
+        self.assertFalse(matrix.exists())
+
+    def test_failed_update_keeps_committed_matrix(self):
+        Women.objects.filter(pk=self.posts[0].pk).update(content_ru=self.texts[2])
+        with patch.object(related_content.ContentMatrix, "store_neighbours", side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            related_content.update_posts([self.posts[0].pk])
+        self.assertEqual(self.related(self.posts[0])[0], self.posts[1].pk)
+        matrix = related_content.ContentMatrix("ru")
+        matrix.open()
+        self.assertEqual(sorted(matrix.ids[matrix.ids != 0]), sorted(post.pk for post in self.posts))
+
+        related_content.update_posts([self.posts[0].pk])
+        self.assertEqual(self.related(self.posts[0])[0], self.posts[2].pk)
+        self.assertEqual(len(os.listdir(matrix.directory)), 2)
+
+
+class CovisitationTests(TestCase):
+    fixtures = ["women_cat.json"]
+
+    def setUp(self):
+        default_cache.clear()
+        self.posts = [Women.objects.create(title=f"Известная женщина {i}", cat_id=1) for i in range(4)]
+
+    def visit(self, visitor, *posts):
+        PageVisit.objects.bulk_create(PageVisit(url=post.slug, session_id=f"{visitor:032x}") for post in posts)
+
+    def related(self, post):
+        return list(RelatedPost.objects.filter(post=post, source=RelatedPost.Source.VISITS)
+                    .values_list("related_id", flat=True))
+
+    def test_posts_seen_together_are_related(self):
+        a, b, c, d = self.posts
+        self.visit(1, a, b, c)
+        self.visit(2, a, b)
+        self.visit(3, a, c)
+        self.visit(4, b)
+        self.visit(5, a, d)
+        PageVisit.objects.create(url=d.slug)
+        stats = covisitation.build()
+        self.assertEqual(stats["visits"], 10)
+        self.assertEqual(stats["visitors"], 5)
+        # Pairs seen by a single visitor are dropped.
+        self.assertEqual(self.related(a), [c.pk, b.pk])
+        self.assertEqual(self.related(d), [])
+
+    @override_settings(COVISIT_CHUNK_PAIRS=2, COVISIT_LIMIT=1)
+    def test_chunks_and_shards_give_same_result(self):
+        a, b, c, d = self.posts
+        for visitor in range(6):
+            self.visit(visitor, a, b if visitor % 3 else c, d)
+        covisitation.build()
+        expected = {post.pk: self.related(post) for post in self.posts}
+        covisitation.build(shards=3)
+        self.assertEqual({post.pk: self.related(post) for post in self.posts}, expected)
+        self.assertEqual(expected[c.pk], [a.pk])
+
+    def test_post_page_shows_also_viewed(self):
+        a, b, *_ = self.posts
+        self.visit(1, a, b)
+        self.visit(2, a, b)
+        call_command("build_covisitation", stdout=StringIO())
+        response = self.client.get(a.get_absolute_url(), HTTP_USER_AGENT="Mozilla/5.0")
+        self.assertEqual(response.context["also_viewed"], [b])
+
+
+@override_settings(TRENDING_HALF_LIFE=24, TRENDING_WEIGHTS={"views_count": 1, "likes": 5, "comments_count": 10})
+class TrendingTests(TestCase):
+    fixtures = ["women_cat.json"]
+
+    def setUp(self):
+        default_cache.clear()
+        self.posts = [Women.objects.create(title=f"Известная женщина {i}", cat_id=1) for i in range(3)]
+
+    def test_events_add_up_and_decay(self):
+        a, b, c = self.posts
+        now = timezone.now()
+        trending.add_events({a.pk: {"views_count": 8}}, when=now - datetime.timedelta(days=2))
+        trending.add_events({a.pk: {"views_count": 1}, b.pk: {"views_count": 2}}, when=now)
+        trending.add_events({b.pk: {"likes": 1, "views_count": -5}, c.pk: {"likes": -1}}, when=now)
+        posts = trending.get_trending(5)
+        self.assertEqual([post["id"] for post in posts], [b.pk, a.pk])
+        self.assertAlmostEqual(posts[0]["score"], 7, places=3)
+        self.assertAlmostEqual(posts[1]["score"], 3, places=3)
+
+    def test_views_votes_and_comments_are_events(self):
+        a, b, c = self.posts
+        add_views({a.pk: 3, b.pk: 1})
+        self.client.post(reverse("rating"), {"votes": [{"post_id": b.pk, "value": 1}]},
+                         content_type="application/json")
+        user = get_user_model().objects.create_user(username="reader", password="secret")
+        Comment.objects.create(post=c, author=user, body="Отличная статья")
+        self.assertEqual(set(TrendingScore.objects.values_list("post_id", flat=True)), {a.pk, b.pk, c.pk})
+        self.assertEqual([post["id"] for post in trending.get_trending(5)], [c.pk, b.pk, a.pk])
+
+    def test_reads_are_cached_and_drafts_hidden(self):
+        a, b, _ = self.posts
+        trending.add_events({a.pk: {"views_count": 1}, b.pk: {"views_count": 2}})
+        Women.objects.filter(pk=b.pk).update(is_published=Women.Status.DRAFT)
+        with self.assertNumQueries(1):
+            trending.get_trending(5)
+        with self.assertNumQueries(0):
+            self.assertEqual([post["id"] for post in trending.get_trending(5)], [a.pk])
+
+    def test_sidebar_and_api(self):
+        trending.add_events({self.posts[1].pk: {"likes": 1}})
+        response = self.client.get(reverse("home"))
+        self.assertContains(response, self.posts[1].get_absolute_url())
+        data = self.client.get(reverse("trending"), {"limit": 1}).json()
+        self.assertEqual([(item["id"], round(item["score"])) for item in data], [(self.posts[1].pk, 5)])
+
+
+class UniqueVisitorTests(TestCase):
+    fixtures = ["women_cat.json"]
+
+    def setUp(self):
+        default_cache.clear()
+        clear_visits()
+        self.post = Women.objects.create(title="Анджелина Джоли", cat_id=1)
+
+    def flush(self):
+        # The flushed visits leave the buffer when the transaction commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            return flush_views(timezone.localdate())
+
+    def view(self, visitor):
+        request = RequestFactory().get("/", HTTP_USER_AGENT="Mozilla/5.0")
+        request.COOKIES[settings.VISITOR_COOKIE_NAME] = f"{visitor:032x}"
+        view = ShowPost()
+        view.setup(request, post_slug=self.post.slug)
+        view.get_object()
+
+    def test_sketch_estimates_and_merges(self):
+        first = hll.add(hll.empty(), (f"visitor-{i}" for i in range(20_000)))
+        second = hll.add(hll.empty(), (f"visitor-{i}" for i in range(10_000, 30_000)))
+        self.assertEqual(len(first), 2 ** settings.HLL_PRECISION)
+        self.assertAlmostEqual(hll.count(first), 20_000, delta=2_000)
+        self.assertAlmostEqual(hll.count(hll.merge(first, second)), 30_000, delta=3_000)
+        self.assertEqual(hll.count(hll.add(hll.empty(), ["a", "b", "a"])), 2)
+        self.assertEqual(hll.count(hll.empty()), 0)
+
+    def test_refreshes_are_not_counted(self):
+        for visitor in (1, 2, 1, 1, 3):
+            self.view(visitor)
+        self.flush()
+        self.view(2)
+        self.view(4)
+        self.flush()
+        self.flush()
+        self.assertEqual(pageviews.get_post_visitors(self.post.pk), {"day": 4, "week": 4, "month": 4})
+        self.assertEqual(get_page_count_views(self.post), 7)
+
+    def test_days_merge_into_week(self):
+        today = timezone.localdate()
+        monday = today - datetime.timedelta(days=today.weekday())
+        for offset, visitors in ((0, ["a", "b"]), (1, ["b", "c"])):
+            pageviews.add_visitors(monday + datetime.timedelta(days=offset),
+                                   [(self.post.slug, visitor, timezone.now()) for visitor in visitors])
+        self.assertEqual(pageviews.get_visitors([self.post.pk], "week", monday), {self.post.pk: 3})
+        self.assertEqual(pageviews.get_visitors([self.post.pk], "day", monday), {self.post.pk: 2})
+
+    @override_settings(PAGEVIEW_STORE_VISITS=False)
+    def test_post_page_shows_visitors(self):
+        self.view(1)
+        self.flush()
+        self.assertFalse(PageVisit.objects.exists())
+        response = self.client.get(self.post.get_absolute_url(), HTTP_USER_AGENT="Mozilla/5.0")
+        self.assertEqual(response.context["visitors"], {"day": 1, "week": 1, "month": 1})
+
+
+class CommentTreeTests(TestCase):
+    fixtures = ["women_cat.json"]
+
+    def setUp(self):
+        default_cache.clear()
+        self.post = Women.objects.create(title="Анджелина Джоли", cat_id=1, is_published=Women.Status.PUBLISHED)
+        User = get_user_model()
+        self.author = User.objects.create_user(username="author", password="secret")
+        self.reader = User.objects.create_user(username="reader", password="secret")
+        with self.captureOnCommitCallbacks(execute=True), translation.override("ru"):
+            self.comment = Comment.objects.create(post=self.post, author=self.author, body="Первый комментарий")
+            self.reply = Comment.objects.create(post=self.post, author=self.reader, body="Второй уровень",
+                                                parent=self.comment)
+
+    def render(self, user):
+        with translation.override("ru"):
+            return comment_tree.render_comments(self.post, user)
+
+    def get_json(self, name, *args, **params):
+        with translation.override("ru"):
+            url = reverse(name, args=(self.post.slug, *args))
+        return self.client.get(url, params)
+
+    def test_first_page_is_one_query_then_cached(self):
+        with self.assertNumQueries(1):
+            html = self.render(self.reader)
+        self.assertIn("Первый комментарий", html)
+        self.assertNotIn("Второй уровень", html)
+        self.assertIn(f"/comments/{self.comment.pk}/replies/", html)
+        self.assertNotIn("comments-more", html)
+        with self.assertNumQueries(0):
+            self.render(self.reader)
+
+    def test_user_specific_parts(self):
+        with translation.override("ru"):
+            edit_url = reverse("edit_comment", args=(self.post.pk, self.comment.pk))
+        self.assertIn(edit_url, self.render(self.author))
+        reader_html = self.render(self.reader)
+        self.assertNotIn(edit_url, reader_html)
+        self.assertIn("btn-reply", reader_html)
+        anonymous_html = self.render(AnonymousUser())
+        self.assertNotIn("btn-reply", anonymous_html)
+        self.assertNotIn("<!--", anonymous_html)
+
+    def test_changes_bump_the_version(self):
+        self.render(self.reader)
+        with self.captureOnCommitCallbacks(execute=True), translation.override("ru"):
+            Comment.objects.create(post=self.post, author=self.reader, body="Новый комментарий")
+        self.assertIn("Новый комментарий", self.render(self.reader))
+        self.comment.active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.comment.save()
+        self.assertNotIn("Первый комментарий", self.render(self.reader))
+
+    @override_settings(COMMENTS_PAGE_SIZE=1)
+    def test_pages(self):
+        with self.captureOnCommitCallbacks(execute=True), translation.override("ru"):
+            Comment.objects.create(post=self.post, author=self.reader, body="Новый комментарий")
+        html = self.render(self.reader)
+        self.assertIn("Первый комментарий", html)
+        self.assertNotIn("Новый комментарий", html)
+        self.assertIn("comments-more", html)
+
+        data = self.get_json("comment_page", page=2).json()
+        self.assertIn("Новый комментарий", data["html"])
+        self.assertNotIn("Первый комментарий", data["html"])
+        self.assertIsNone(data["next"])
+        self.assertEqual(self.get_json("comment_page", page=3).json(), {"html": "", "next": None})
+
+    def test_replies(self):
+        with self.captureOnCommitCallbacks(execute=True), translation.override("ru"):
+            Comment.objects.create(post=self.post, author=self.author, body="Третий уровень", parent=self.reply)
+            hidden = Comment.objects.create(post=self.post, author=self.author, body="Скрытый", parent=self.comment)
+            hidden.active = False
+            hidden.save()
+        with self.assertNumQueries(2), translation.override("ru"):
+            comment_tree.get_replies(self.post, self.reader, self.comment.pk)
+        self.client.force_login(self.reader)
+        html = self.get_json("comment_replies", self.comment.pk).json()["html"]
+        self.assertIn("Второй уровень", html)
+        self.assertIn("Третий уровень", html)
+        self.assertNotIn("Скрытый", html)
+        self.assertNotIn("Первый комментарий", html)
+        self.assertIn(f'id="comment-thread-{self.reply.pk}"', html)
+
+        other = Women.objects.create(title="Другая статья", cat_id=1, is_published=Women.Status.PUBLISHED)
+        with translation.override("ru"):
+            url = reverse("comment_replies", args=(other.slug, self.comment.pk))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class LanguageDetectionTests(TestCase):
+    def setUp(self):
+        patcher = patch.object(langid, "_model", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch("women.langid.fasttext.load_model")
+    def test_model_is_loaded_once_and_batched(self, load_model):
+        load_model.return_value.predict.return_value = ([["__label__ru"], ["__label__en"]], [[0.9], [0.8]])
+        self.assertEqual(langid.detect_languages(["Привет,\nмир", "Hello world"]), ["ru", "en"])
+        load_model.return_value.predict.assert_called_once_with(["Привет, мир", "Hello world"], k=1)
+        self.assertEqual(langid.detect_languages([]), [])
+        langid.detect_languages(["Hello"])
+        load_model.assert_called_once()
+
+
+class FailingTranslator(translators.OfflineTranslator):
+    def translate(self, text, src, dest):
+        if dest == "be":
+            raise ValueError("invalid destination language")
+        return super().translate(text, src, dest)
+
+
+class TranslationTests(TestCase):
+    fixtures = ["women_cat.json"]
+
+    def setUp(self):
+        default_cache.clear()
+        post = Women.objects.create(title="Анджелина Джоли", cat_id=1)
+        author = get_user_model().objects.create_user(username="author", password="secret")
+        self.comment = Comment.objects.create(post=post, author=author, body_ru="Привет")
+        patcher = patch("women.langid.detect_language", return_value="ru")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def translate(self, translator):
+        with patch.object(translators, "_translator", translator), translation.override("ru"):
+            translate_model_content("Comment", "body", self.comment.pk)
+        self.comment.refresh_from_db()
+
+    def test_every_language_is_requested_once(self):
+        translator = translators.OfflineTranslator()
+        self.translate(translator)
+        self.assertCountEqual(translator.calls, [("ru", "en"), ("ru", "be")])
+        self.assertEqual((self.comment.body_ru, self.comment.body_en, self.comment.body_be),
+                         ("Привет", "[en] Привет", "[be] Привет"))
+
+    def test_failed_languages_are_kept(self):
+        self.comment.body_be = "Прывітанне"
+        self.comment.save()
+        with self.assertLogs("women.tasks", "WARNING") as logs:
+            self.translate(FailingTranslator())
+        self.assertEqual((self.comment.body_en, self.comment.body_be), ("[en] Привет", "Прывітанне"))
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("from ru", logs.output[0])
+        self.assertIsNotNone(logs.records[0].exc_info)
+
+    def test_requests_run_concurrently(self):
+        translator = translators.OfflineTranslator(delay=0.2)
+        started = time.perf_counter()
+        translations, errors = translators.translate("Hello", "en", translator)
+        self.assertLess(time.perf_counter() - started, 0.35)
+        self.assertEqual(translations, {"ru": "[ru] Hello", "be": "[be] Hello"})
+        self.assertEqual(errors, [])
+
+    def test_memory_is_used_before_the_translator(self):
+        self.translate(translators.OfflineTranslator())
+        translator = translators.OfflineTranslator()
+        self.comment.body_ru = "  Привет\n"
+        self.comment.save()
+        self.translate(translator)
+        self.assertEqual(translator.calls, [])
+        self.assertEqual(self.comment.body_en, "  [en] Привет\n")
+
+        default_cache.delete_many([translation_memory.get_key("ru", target, translation_memory.get_hash("Привет"))
+                                   for target in ("en", "be")])
+        self.comment.body_ru = "Пока"
+        self.comment.save()
+        self.translate(translator)
+        self.translate(translator)
+        self.assertCountEqual(translator.calls, [("ru", "en"), ("ru", "be")])
+        self.assertEqual(TranslationMemory.objects.count(), 4)
+
+        text_hash = translation_memory.get_hash("Привет")
+        found = translation_memory.lookup("ru", [text_hash], ["en", "be"])
+        self.assertEqual(found, {(text_hash, "en"): "[en] Привет", (text_hash, "be"): "[be] Привет"})
+        self.assertEqual(translation_memory.get_stats(), {"cache_hits": 4, "database_hits": 2, "misses": 4,
+                                                          "hit_ratio": 0.6})
+
+    def test_only_changed_segments_are_translated(self):
+        html = ('<h2>Биография</h2>\n<p>Родилась в <strong>Лос-Анджелесе</strong>.</p>\n'
+                '<ul>\n  <li>Актриса</li>\n  <li>Режиссёр</li>\n</ul>')
+        translator = translators.OfflineTranslator()
+        translations, errors = segments.translate(html, "ru", translator)
+        self.assertEqual(errors, [])
+        self.assertEqual(translations["en"], '<h2>[en] Биография</h2>\n<p>[en] Родилась в <strong>Лос-Анджелесе'
+                                             '</strong>.</p>\n<ul>\n  <li>[en] Актриса</li>\n  <li>[en] Режиссёр</li>\n</ul>')
+        self.assertEqual(len(translator.calls), 8)
+
+        translator = translators.OfflineTranslator()
+        translations, _ = segments.translate(html.replace("Режиссёр", "Продюсер"), "ru", translator)
+        self.assertCountEqual(translator.calls, [("ru", "en"), ("ru", "be")])
+        self.assertIn("<li>[be] Продюсер</li>", translations["be"])
+        self.assertIn("<li>[be] Актриса</li>", translations["be"])
+
+    def test_deleted_object_is_skipped(self):
+        translator = translators.OfflineTranslator()
+        pk = self.comment.pk
+        self.comment.delete()
+        with patch.object(translators, "_translator", translator):
+            translate_model_content("Comment", "body", pk)
+        self.assertEqual(translator.calls, [])
+
+    @patch("women.tasks.translate_model_content.apply_async")
+    def test_edit_storm_is_translated_once(self, apply_async):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                dispatch.schedule_translation("Comment", "body", self.comment.pk)
+        self.assertEqual([call.args[0][3] for call in apply_async.call_args_list], [1, 2, 3])
+
+        translator = translators.OfflineTranslator()
+        with patch.object(translators, "_translator", translator), translation.override("ru"):
+            for call in apply_async.call_args_list:
+                translate_model_content(*call.args[0])
+        self.assertCountEqual(translator.calls, [("ru", "en"), ("ru", "be")])
@@ -0,0 +1,98 @@
+"""Translations already made, reused when the same text is translated again.
+
+Entries are keyed by the source and target languages and the SHA-256 of the
+text with its whitespace collapsed. They are kept in the TranslationMemory
+table, and the entries in use also in the cache for
+TRANSLATION_MEMORY_CACHE_TIMEOUT. Hits of both tiers and misses are counted
+in the cache, see get_stats().
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import TranslationMemory
+from . import translators
+
+STATS = ("cache_hits", "database_hits", "misses")
+
+
+def get_hash(text: str) -> str:
+    return hashlib.sha256(" ".join(text.split()).encode()).hexdigest()
+
+
+def get_key(source: str, target: str, text_hash: str) -> str:
+    return f"translation_memory:{source}:{target}:{text_hash}"
+
+
+def count(stat: str, number: int) -> None:
+    if number:
+        key = f"translation_memory:stats:{stat}"
+        try:
+            cache.incr(key, number)
+        except ValueError:
+            if not cache.add(key, number, None):
+                cache.incr(key, number)
+
+
+def lookup(source: str, text_hashes, targets: list[str]) -> dict[tuple[str, str], str]:
+    """Stored translations of the texts with the given hashes, by (hash, target language)."""
+    keys = {get_key(source, target, text_hash): (text_hash, target) for text_hash in text_hashes for target in targets}
+    found = {keys[key]: translation for key, translation in cache.get_many(keys).items()}
+    count("cache_hits", len(found))
+    missing = [pair for pair in keys.values() if pair not in found]
+    if missing:
+        stored = {(text_hash, target): translation for text_hash, target, translation in
+                  TranslationMemory.objects.filter(source_language=source,
+                                                   text_hash__in={text_hash for text_hash, _ in missing},
+                                                   target_language__in={target for _, target in missing})
+                  .values_list("text_hash", "target_language", "translation")}
+        cache.set_many({get_key(source, target, text_hash): translation
+                        for (text_hash, target), translation in stored.items()},
+                       settings.TRANSLATION_MEMORY_CACHE_TIMEOUT)
+        count("database_hits", len(stored))
+        found.update(stored)
+    return found
+
+
+def remember(source: str, translations: dict[tuple[str, str], str]) -> None:
+    TranslationMemory.objects.bulk_create(
+        [TranslationMemory(source_language=source, target_language=target, text_hash=text_hash,
+                           translation=translation) for (text_hash, target), translation in translations.items()],
+        update_conflicts=True, unique_fields=["source_language", "target_language", "text_hash"],
+        update_fields=["translation"], batch_size=1000)
+    cache.set_many({get_key(source, target, text_hash): translation
+                    for (text_hash, target), translation in translations.items()},
+                   settings.TRANSLATION_MEMORY_CACHE_TIMEOUT)
+
+
+def translate_many(texts: list[str], language: str, translator=None) -> tuple[dict[str, dict[str, str]], list]:
+    """Like translators.translate for every text, only asking the translator for what the memory does not have."""
+    hashes = {text: get_hash(text) for text in texts}
+    texts_by_hash = {text_hash: text for text, text_hash in hashes.items()}
+    targets = translators.get_targets(language)
+    found = lookup(language, texts_by_hash, targets)
+    missing = [(text, target) for text_hash, text in texts_by_hash.items() for target in targets
+               if (text_hash, target) not in found]
+    count("misses", len(missing))
+    errors = []
+    if missing:
+        translations, errors = translators.translate_many(missing, language, translator)
+        translations = {(hashes[text], target): translation for (text, target), translation in translations.items()}
+        if translations:
+            remember(language, translations)
+        found.update(translations)
+    return {text: {target: found[text_hash, target] for target in targets if (text_hash, target) in found}
+            for text, text_hash in hashes.items()}, errors
+
+
+def translate(text: str, language: str, translator=None) -> tuple[dict[str, str], list]:
+    translations, errors = translate_many([text], language, translator)
+    return translations[text], errors
+
+
+def get_stats() -> dict:
+    stats = {stat: cache.get(f"translation_memory:stats:{stat}", 0) for stat in STATS}
+    lookups = sum(stats.values())
+    stats["hit_ratio"] = (stats["cache_hits"] + stats["database_hits"]) / lookups if lookups else 0.0
+    return stats
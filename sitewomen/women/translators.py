@@ -0,0 +1,86 @@
+"""Machine translation of content into the languages of the site.
+
+TRANSLATOR_BACKEND names the backend class: GoogleTranslator, which keeps one
+HTTP client per process so connections are reused between tasks, or
+OfflineTranslator, which needs no network, for tests and benchmarks. The
+languages a text needs are requested at the same time, each once, at most
+TRANSLATOR_CONCURRENCY at a time.
+"""
+import asyncio
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from googletrans import Translator
+
+_translator = None
+
+
+class BaseTranslator:
+    def translate(self, text: str, src: str, dest: str) -> str:
+        raise NotImplementedError
+
+    async def translate_async(self, text: str, src: str, dest: str) -> str:
+        return await asyncio.to_thread(self.translate, text, src, dest)
+
+
+class GoogleTranslator(BaseTranslator):
+    def __init__(self):
+        self.translator = Translator(timeout=settings.TRANSLATOR_TIMEOUT)
+
+    def translate(self, text, src, dest):
+        return self.translator.translate(text, src=src, dest=dest).text
+
+
+class OfflineTranslator(BaseTranslator):
+    """Marks the text with the target language, after an optional delay standing in for the network."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = []
+
+    def translate(self, text, src, dest):
+        self.calls.append((src, dest))
+        if self.delay:
+            time.sleep(self.delay)
+        return f"[{dest}] {text}"
+
+
+def get_translator() -> BaseTranslator:
+    global _translator
+    if _translator is None:
+        _translator = import_string(settings.TRANSLATOR_BACKEND)()
+    return _translator
+
+
+async def translate_all(translator: BaseTranslator, requests: list[tuple[str, str]], src: str) -> list:
+    semaphore = asyncio.Semaphore(settings.TRANSLATOR_CONCURRENCY)
+
+    async def translate_one(text, dest):
+        async with semaphore:
+            return await translator.translate_async(text, src, dest)
+
+    return await asyncio.gather(*(translate_one(text, dest) for text, dest in requests), return_exceptions=True)
+
+
+def get_targets(language: str) -> list[str]:
+    return [code for code in dict.fromkeys(settings.MODELTRANSLATION_LANGUAGES) if code != language]
+
+
+def translate_many(requests: list[tuple[str, str]], language: str,
+                   translator: BaseTranslator | None = None) -> tuple[dict[tuple[str, str], str], list]:
+    """Translations of (text, target language) pairs of texts in the given language, requested
+    concurrently and each once, and the errors of the pairs that failed."""
+    requests = list(dict.fromkeys(requests))
+    results = asyncio.run(translate_all(translator or get_translator(), requests, language))
+    translations = {request: result for request, result in zip(requests, results) if not isinstance(result, Exception)}
+    return translations, [result for result in results if isinstance(result, Exception)]
+
+
+def translate(text: str, language: str, translator: BaseTranslator | None = None,
+              targets: list[str] | None = None) -> tuple[dict[str, str], list]:
+    """Translations of a text in the given language into the targets, every other language of the site
+    by default, and the errors of the languages that failed."""
+    targets = get_targets(language) if targets is None else targets
+    translations, errors = translate_many([(text, dest) for dest in targets], language, translator)
+    return {dest: translation for (_, dest), translation in translations.items()}, errors
@@ -0,0 +1,66 @@
+"""Posts popular right now.
+
+The trending score of a post is the sum of its events (views, likes, comments)
+weighted by TRENDING_WEIGHTS and decayed by half every TRENDING_HALF_LIFE
+hours. Instead of decaying every score as time passes, every event is weighted
+up by exp(rate * (time - EPOCH)) when it arrives (forward decay), so stored
+scores never change on their own and their order is the current order. The
+weights grow without bound, so TrendingScore keeps the logarithm of the sum and
+an event adds to it with logaddexp in one upsert.
+"""
+import datetime
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from .models import Women, TrendingScore
+
+EPOCH = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+TRENDING_KEY = "trending:{}"
+
+ADD_EVENTS = """
+    INSERT INTO women_trendingscore (post_id, score) VALUES {values}
+    ON CONFLICT (post_id) DO UPDATE SET score =
+        GREATEST(women_trendingscore.score, EXCLUDED.score) +
+        LN(1 + EXP(-ABS(women_trendingscore.score - EXCLUDED.score)))
+"""
+
+
+def get_rate() -> float:
+    return math.log(2) / (settings.TRENDING_HALF_LIFE * 3600)
+
+
+def get_log_weight(weight: float, when: datetime.datetime) -> float:
+    return math.log(weight) + get_rate() * (when - EPOCH).total_seconds()
+
+
+def add_events(deltas_by_post: dict[int, dict[str, int]], when=None) -> None:
+    """Add counter increments ({post_id: {field: delta}}) as events. Decrements are ignored,
+    an undone like or a removed comment simply decays like the others."""
+    when = when or timezone.now()
+    weights = {}
+    for post_id, deltas in deltas_by_post.items():
+        weight = sum(settings.TRENDING_WEIGHTS.get(field, 0) * delta for field, delta in deltas.items() if delta > 0)
+        if weight > 0:
+            weights[post_id] = get_log_weight(weight, when)
+    if weights:
+        with connection.cursor() as cursor:
+            cursor.execute(ADD_EVENTS.format(values=", ".join(["(%s, %s)"] * len(weights))),
+                           [value for item in weights.items() for value in item])
+
+
+def get_trending(limit: int) -> list[dict]:
+    """The limit posts with the highest score, as dicts of their id, title, slug and current score."""
+    key = TRENDING_KEY.format(limit)
+    posts = cache.get(key)
+    if posts is None:
+        rows = (TrendingScore.objects.filter(post__is_published=Women.Status.PUBLISHED)
+                .order_by("-score").values_list("post_id", "post__title", "post__slug", "score")[:limit])
+        now = get_rate() * (timezone.now() - EPOCH).total_seconds()
+        posts = [{"id": pk, "title": title, "slug": slug, "score": math.exp(score - now)}
+                 for pk, title, slug, score in rows]
+        cache.set(key, posts, settings.TRENDING_CACHE_TIMEOUT)
+    return posts
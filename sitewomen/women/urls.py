@@ -16,7 +16,10 @@ urlpatterns = [
     path(_("tag/<slug:tag_slug>/"), views.ShowPostsByTag.as_view(), name="tag"),
     path(_("edit_post/<slug:slug>/"), views.UpdatePage.as_view(), name="edit_post"),
     path(_("delete_post/<slug:slug>/"), views.DeletePage.as_view(), name="delete_post"),
+    path('post/<slug:post_slug>/comments/', views.comment_page, name='comment_page'),
+    path('post/<slug:post_slug>/comments/<int:comment_id>/replies/', views.comment_replies, name='comment_replies'),
     path('post/<slug:post_slug>/comments/create/', views.CommentCreateView.as_view(), name='comment_create_view'),
     path('edit_comment/<int:post_id>/<int:comment_id>/', views.edit_comment, name='edit_comment'),
     path('rating/', views.RatingCreateView.as_view(), name='rating'),
+    path('suggest/', views.suggest, name='suggest'),
 ]
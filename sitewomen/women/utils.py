@@ -1,10 +1,28 @@
-from django.contrib.postgres.search import TrigramSimilarity, TrigramWordSimilarity
-from django.db.models import Prefetch, ExpressionWrapper, FloatField
+import hashlib
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                           TrigramSimilarity, TrigramWordSimilarity)
+from django.conf import settings
+from django.core.paginator import Page
+from django.db.models import Prefetch, ExpressionWrapper, F, FloatField
+from django.http import Http404
+from django.utils.text import Truncator
+from django.utils.translation import get_language
 from django.views.generic.base import ContextMixin
+from django.views.generic.list import MultipleObjectMixin
 from django.urls import resolve
 
-from .models import TagPost
+from . import cache
+from .counters import apply_counters, remember_counters
+from .models import TagPost, Women, Rating
 from .forms import SearchForm
+from .search import SearchResults, normalize_query
+from .paginators import CountingPaginator, KeysetPaginator, KeysetPage, InvalidCursor
+
+
+def get_client_ip(request):
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    return x_forwarded_for.split(',')[0] if x_forwarded_for else request.META.get('REMOTE_ADDR')
 
 
 class DataMixin(ContextMixin):
@@ -12,6 +30,8 @@ class DataMixin(ContextMixin):
     title = None
     paginate_by = 3
     template_name = 'women/content.html'
+    # Views rendering the rating buttons of their posts load the visitor's votes for them.
+    shows_votes = False
 
     def __init__(self):
         if self.title is not None:
@@ -21,13 +41,28 @@ class DataMixin(ContextMixin):
         context = super().get_context_data(**kwargs)
         if "cat_selected" not in context:
             context["cat_selected"] = None
-        if "paginator" in context:
+        if "paginator" in context and not getattr(context["paginator"], "uses_cursor", False):
             context["elided_page_range"] = context["paginator"].get_elided_page_range(
                         context["page_obj"].number, on_each_side=2, on_ends=1)
-        x_forwarded_for = self.request.META.get('HTTP_X_FORWARDED_FOR')
-        context["ip"] = x_forwarded_for.split(',')[0] if x_forwarded_for else self.request.META.get('REMOTE_ADDR')
+        context["ip"] = get_client_ip(self.request)
+        if self.shows_votes:
+            context["user_votes"] = self.get_user_votes(context)
         return context
 
+    @staticmethod
+    def get_user_votes(context):
+        """Votes of the visitor's ip address for every post on the page, loaded with one query."""
+        posts = context.get("object_list")
+        if posts is None:
+            posts = [context["object"]] if isinstance(context.get("object"), Women) else []
+        # Listings hold post cards, see ListingCacheMixin.make_card.
+        post_ids = [post["id"] if isinstance(post, dict) else post.pk
+                    for post in posts if isinstance(post, (dict, Women))]
+        if not post_ids:
+            return {}
+        return dict(Rating.objects.filter(ip_address=context["ip"], post_id__in=post_ids)
+                    .values_list("post_id", "value"))
+
     def get_template_names(self):
         if self.request.headers.get('Hx-Request'):
             return ['women/content.html']
@@ -44,20 +79,166 @@ class SearchFieldMixin(ContextMixin):
         context["route_name"] = resolved.url_name
         return context
 
+    def get_search_results(self, queryset):
+        query = normalize_query(self.request.GET.get("query") or "")
+        if not query:
+            return self.calculate_similarity(query, queryset)
+
+        match = self.request.resolver_match
+        param = ":".join(str(value) for value in match.kwargs.values())
+        key = f"search:{match.url_name}:{param}:{get_language()}:{hashlib.md5(query.encode()).hexdigest()}"
+        ids = cache.get_or_set_once(
+            key,
+            lambda: list(self.calculate_similarity(query, queryset).values_list("pk", flat=True)),
+            tags=self.get_search_cache_tags(),
+        )
+        return SearchResults(ids, self.calculate_similarity(None, queryset))
+
+    def get_search_cache_tags(self):
+        # Listings scoped to a category or tag drop their searches with their pages; other searches follow every post.
+        if hasattr(self, "get_cache_tags"):
+            return self.get_cache_tags()
+        return (cache.POSTS_TAG, cache.CATALOG_TAG)
+
     @staticmethod
     def calculate_similarity(query, queryset):
         if query:
-            A = 1.0
-            B = 0.4
-            total = A + B
-
-            queryset = queryset.annotate(
-                similarity=ExpressionWrapper(
-                    (A / total * TrigramSimilarity('title', query)) +
-                    (B / total * TrigramWordSimilarity(query, 'content')),
-                    output_field=FloatField()
-                )
-            ).filter(similarity__gte=0.2).order_by('-similarity')
+            language = get_language()
+            if language not in settings.SEARCH_CONFIGS:
+                language = settings.MODELTRANSLATION_DEFAULT_LANGUAGE
+            search_query = SearchQuery(query, config=settings.SEARCH_CONFIGS[language], search_type="websearch")
+            vector_field = f"search_vector_{language}"
+            ranked = queryset.filter(**{vector_field: search_query}).annotate(
+                similarity=SearchRank(F(vector_field), search_query)
+            ).order_by('-similarity', '-time_create')
+
+            if ranked.exists():
+                queryset = ranked
+            else:
+                # Nothing matched the indexed lexemes, most likely a typo: fall back to trigram similarity.
+                A = 1.0
+                B = 0.4
+                total = A + B
+
+                queryset = queryset.annotate(
+                    similarity=ExpressionWrapper(
+                        (A / total * TrigramSimilarity('title', query)) +
+                        (B / total * TrigramWordSimilarity(query, 'content')),
+                        output_field=FloatField()
+                    )
+                ).filter(similarity__gte=0.2).order_by('-similarity')
 
         return queryset.select_related("author", "cat").prefetch_related(
-                        Prefetch("tags", TagPost.objects.all()))
\ No newline at end of file
+                        Prefetch("tags", TagPost.objects.all()))
+
+
+class ListingCacheMixin(MultipleObjectMixin):
+    """Caches rendered-ready pages of posts instead of lazy querysets.
+
+    An entry holds the ordered ids, the page's post cards (plain dicts with what
+    the listing shows, see make_card) and the total count, keyed by route, param, page,
+    language and search query. With keyset pagination the page is addressed by
+    its cursor instead of a number. Engagement counters change too often to be
+    part of the entry and are refreshed from their own cache keys.
+    """
+    cache_tags = ()
+    cursor_kwarg = "cursor"
+    paginator_class = CountingPaginator
+
+    def get_cache_tags(self):
+        return (*self.cache_tags, cache.CATALOG_TAG)
+
+    def get_listing_cache_key(self, page_number):
+        match = self.request.resolver_match
+        param = ":".join(str(value) for value in match.kwargs.values())
+        query = normalize_query(self.request.GET.get("query") or "")
+        query_hash = hashlib.md5(query.encode()).hexdigest() if query else ""
+        return f"listing:{match.url_name}:{param}:{page_number}:{get_language()}:{query_hash}"
+
+    @staticmethod
+    def make_card(post) -> dict:
+        return {
+            "id": post.pk,
+            "title": post.title,
+            "slug": post.slug,
+            "url": post.get_absolute_url(),
+            "excerpt": Truncator(post.content).words(30),
+            # Resolving the thumbnail checks the storage, so it is done once per cached page.
+            "thumbnail_url": post.thumbnail.url,
+            "category": str(post.cat),
+            "time_update": post.time_update,
+            "author_id": post.author_id,
+            "author_name": post.author.username if post.author else None,
+            "tags": [(tag.tag, tag.slug) for tag in post.tags.all()],
+            **{field: getattr(post, field) for field in Women.COUNTER_FIELDS},
+        }
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return super().get_paginator(queryset, per_page, orphans, allow_empty_first_page,
+                                     cache_tags=self.get_cache_tags(), **kwargs)
+
+    def get_pagination_mode(self):
+        # Search results are ordered by rank, so they can only be paged by offset.
+        if self.request.GET.get("query"):
+            return "offset"
+        if self.cursor_kwarg in self.request.GET:
+            return "keyset"
+        return settings.LISTING_PAGINATION
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.get_pagination_mode() == "keyset":
+            return self.paginate_queryset_by_cursor(queryset, page_size)
+
+        page_number = self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg) or 1
+        key = self.get_listing_cache_key(page_number)
+        tags = self.get_cache_tags()
+        entry = cache.get_tagged(key, tags)
+        if entry is None:
+            paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+            if isinstance(queryset, SearchResults):
+                object_list = queryset.hydrate(object_list)
+            cards = [self.make_card(post) for post in object_list]
+            entry = {
+                "ids": [card["id"] for card in cards],
+                "cards": cards,
+                "number": page.number,
+                "count": paginator.count,
+                "is_estimated": paginator.is_estimated,
+            }
+            cache.set_tagged(key, entry, tags)
+            remember_counters(cards)
+        else:
+            apply_counters(entry["cards"])
+
+        paginator = self.get_paginator(queryset, page_size, orphans=self.get_paginate_orphans(),
+                                       allow_empty_first_page=self.get_allow_empty())
+        paginator.count = entry["count"]
+        paginator.is_estimated = entry["is_estimated"]
+        page = Page(entry["cards"], entry["number"], paginator)
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def paginate_queryset_by_cursor(self, queryset, page_size):
+        cursor = self.request.GET.get(self.cursor_kwarg) or ""
+        key = self.get_listing_cache_key(f"cursor-{hashlib.md5(cursor.encode()).hexdigest()}")
+        tags = self.get_cache_tags()
+        paginator = KeysetPaginator(queryset, page_size)
+        entry = cache.get_tagged(key, tags)
+        if entry is None:
+            try:
+                page = paginator.page(cursor)
+            except InvalidCursor as e:
+                raise Http404(str(e))
+            cards = [self.make_card(post) for post in page.object_list]
+            entry = {
+                "ids": [card["id"] for card in cards],
+                "cards": cards,
+                "next_cursor": page.next_cursor,
+                "previous_cursor": page.previous_cursor,
+            }
+            cache.set_tagged(key, entry, tags)
+            remember_counters(cards)
+        else:
+            apply_counters(entry["cards"])
+
+        page = KeysetPage(entry["cards"], paginator, entry["next_cursor"], entry["previous_cursor"])
+        return paginator, page, page.object_list, page.has_other_pages()
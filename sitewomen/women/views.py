@@ -1,10 +1,11 @@
+import json
+
 from django.contrib import messages
 from django.contrib.messages.views import SuccessMessageMixin
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.core.mail import EmailMessage
-from django.core.cache import cache
 from django.forms import ValidationError
-from django.db.models import Count
+from django.db import transaction
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, render, redirect, reverse
 from django.template.defaultfilters import timesince
@@ -15,35 +16,33 @@ from django.views.generic import (View, ListView, DetailView,
 from django.urls import reverse_lazy
 from django.utils.translation import gettext_lazy as _, ngettext, get_language
 
-from .models import Women, TagPost, Category, Comment, PageVisit, Rating
+from .models import Women, TagPost, Category, Comment, Rating
 from .forms import AddPostForm, ContactForm, CommentForm
-from .utils import DataMixin, SearchFieldMixin
-from .tasks import translate_model_content
+from .utils import DataMixin, SearchFieldMixin, ListingCacheMixin, get_client_ip
+from .dispatch import schedule_translation
+from .suggest import suggest_index, MAX_LIMIT
+from .pageviews import count_view, remember_visitor
+from .votes import cast_votes, MAX_BATCH
+from .related import get_related_posts, get_also_viewed
+from .comment_tree import get_page, get_replies
+from . import cache
 from services.mixins import AuthorRequiredMixin
 from sitewomen import settings
 
 
-def delete_cache_keys(category: str, tags: list[str]) -> None:
-    cache.delete("cached_women_list")
-    cache.delete(f"cached_list_by_category_{category}")
-    if tags:
-        for tag in tags:
-            cache.delete(f"cached_list_by_tag_{tag}")
-
-
-class HomePage(DataMixin, SearchFieldMixin, ListView):
+class HomePage(DataMixin, SearchFieldMixin, ListingCacheMixin, ListView):
     template_name = "women/index.html"
     context_object_name = 'posts'
+    shows_votes = True
     title = _("Home page")
     extra_context = {
         "cat_selected":  0
     }
     paginate_by = 6
+    cache_tags = (cache.POSTS_TAG, )
 
     def get_queryset(self):
-        query = self.request.GET.get("query")
-        queryset = cache.get_or_set("cached_women_list", Women.published.all())
-        return self.calculate_similarity(query, queryset)
+        return self.get_search_results(Women.published.all())
 
 
 class About(LoginRequiredMixin, DataMixin, TemplateView):
@@ -54,28 +53,30 @@ class About(LoginRequiredMixin, DataMixin, TemplateView):
 class ShowPost(DataMixin, DetailView):
     template_name = "women/post.html"
     context_object_name = "post"
+    shows_votes = True
     slug_url_kwarg = "post_slug"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         post = context["post"]
-        post_tags = post.tags.all()
-        similar_posts = Women.published.filter(tags__in=post_tags).exclude(pk=post.id)
-        similar_posts = similar_posts.annotate(same_tags=Count('tags')).order_by('-same_tags', '-time_update')[:4]
         context["title"] = post.title
         context["cat_selected"] = post.cat.pk
-        context["comments"] = post.comments.filter(active=True, parent=None)
         context["form"] = CommentForm()
-        context["similar_posts"] = similar_posts
+        context["similar_posts"] = get_related_posts(post, 4, get_language())
+        context["also_viewed"] = get_also_viewed(post, 4)
         context["login_url"] = reverse("users:login") + f"?next={post.get_absolute_url()}"
         return context
 
     def get_object(self, queryset=None):
         self.slug = self.kwargs[self.slug_url_kwarg]
-        PageVisit.objects.create(
-            url=self.slug
-        )
-        return get_object_or_404(Women.published, slug=self.slug)
+        post = get_object_or_404(Women.published, slug=self.slug)
+        count_view(self.request, self.slug)
+        return post
+
+    def render_to_response(self, context, **response_kwargs):
+        response = super().render_to_response(context, **response_kwargs)
+        remember_visitor(self.request, response)
+        return response
 
 
 class AddPage(PermissionRequiredMixin, SuccessMessageMixin, DataMixin, CreateView):
@@ -93,8 +94,7 @@ class AddPage(PermissionRequiredMixin, SuccessMessageMixin, DataMixin, CreateVie
         w.content_be = w.content
         w.author = self.request.user
         w.save()
-        translate_model_content.delay("Women", "content", w.pk)
-        delete_cache_keys(w.cat.slug, [tag.slug for tag in w.tags.all()])
+        schedule_translation("Women", "content", w.pk)
         return super().form_valid(form)
 
 
@@ -112,9 +112,8 @@ class UpdatePage(AuthorRequiredMixin, SuccessMessageMixin, DataMixin, UpdateView
         w.content_ru = w.content
         w.content_en = w.content
         w.content_be = w.content
-        w.save()
-        translate_model_content.delay("Women", "content", w.pk)
-        delete_cache_keys(w.cat.slug, [tag.slug for tag in w.tags.all()])
+        w.save(update_fields=w.get_edit_fields())
+        schedule_translation("Women", "content", w.pk)
         return super().form_valid(form)
 
     def get_form(self, form_class=None):
@@ -132,10 +131,6 @@ class DeletePage(AuthorRequiredMixin, DataMixin, DeleteView):
     model = Women
     title = _("Delete article")
 
-    def form_valid(self, form):
-        delete_cache_keys(self.object.cat.slug, [tag.slug for tag in self.object.tags.all()])
-        return super().form_valid(form)
-
 
 class Contact(LoginRequiredMixin, DataMixin, FormView):
     form_class = ContactForm
@@ -162,19 +157,19 @@ class Contact(LoginRequiredMixin, DataMixin, FormView):
             return self.form_invalid(form)
 
 
-class ShowCategory(DataMixin, SearchFieldMixin, ListView):
+class ShowCategory(DataMixin, SearchFieldMixin, ListingCacheMixin, ListView):
     template_name = "women/index.html"
     context_object_name = "posts"
+    shows_votes = True
     allow_empty = True
 
     def get_queryset(self):
-        query = self.request.GET.get("query")
         cat_slug = self.kwargs["cat_slug"]
         self.parent_category = Category.objects.get(slug=cat_slug)
         parent_and_descendants = self.parent_category.get_descendants(include_self=True)
         slugs = parent_and_descendants.values_list("slug", flat=True)
-        queryset = cache.get_or_set(f"cached_list_by_category_{cat_slug}", Women.published.filter(cat__slug__in=slugs))
-        return self.calculate_similarity(query, queryset)
+        self.cache_tags = (cache.category_tag(self.parent_category.pk), )
+        return self.get_search_results(Women.published.filter(cat__slug__in=slugs))
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -186,25 +181,38 @@ class ShowCategory(DataMixin, SearchFieldMixin, ListView):
         return context
 
 
-class ShowPostsByTag(DataMixin, SearchFieldMixin, ListView):
+class ShowPostsByTag(DataMixin, SearchFieldMixin, ListingCacheMixin, ListView):
     template_name = "women/index.html"
     context_object_name = "posts"
+    shows_votes = True
 
     def get_queryset(self):
         tag_slug = self.kwargs["tag_slug"]
-        query = self.request.GET.get("query")
-        queryset = cache.get_or_set(f"cached_list_by_tag_{tag_slug}", Women.published.filter(tags__slug=tag_slug))
-        return self.calculate_similarity(query, queryset)
+        self.tag = get_object_or_404(klass=TagPost, slug=tag_slug)
+        self.cache_tags = (cache.tag_tag(self.tag.pk), )
+        return self.get_search_results(Women.published.filter(tags__slug=tag_slug))
 
     def get_context_data(self, *, object_list=None, **kwargs):
-        tag_slug = self.kwargs["tag_slug"]
         context = super().get_context_data(**kwargs)
-        tag = get_object_or_404(klass=TagPost, slug=tag_slug)
+        tag = self.tag
         context["title"] = _("Tag - %(tag)s") % {"tag": tag.tag}
         context["param"] = tag.slug
         return context
 
 
+def suggest(request):
+    try:
+        limit = min(max(int(request.GET.get("limit", settings.SUGGEST_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        limit = settings.SUGGEST_LIMIT
+    found = suggest_index.search(request.GET.get("q", ""), get_language(), limit)
+    routes = {"posts": "post", "tags": "tag", "categories": "category"}
+    return JsonResponse({
+        kind: [{"label": label, "url": reverse(routes[kind], args=(slug,))} for label, slug in items]
+        for kind, items in found.items()
+    })
+
+
 def tr_handler404(request, exception):
     error_message = str(exception) if exception else _("Unfortunately, this page was not found or has been moved")
     return render(request=request, template_name='errors/error_page.html', status=404, context={
@@ -247,9 +255,10 @@ class CommentCreateView(LoginRequiredMixin, CreateView):
         comment.body_ru = comment.body
         comment.body_en = comment.body
         comment.body_be = comment.body
-        comment.save()
-        translate_model_content.delay("Comment", "body", comment.pk)
-        count_comments = Comment.objects.filter(post=comment.post_id, active=True, parent=None).count()
+        with transaction.atomic():
+            comment.save()
+            count_comments = Women.objects.values_list("comments_count", flat=True).get(pk=comment.post_id)
+        schedule_translation("Comment", "body", comment.pk)
 
         if self.is_ajax():
             return JsonResponse({
@@ -285,6 +294,21 @@ class CommentCreateView(LoginRequiredMixin, CreateView):
         return JsonResponse({'error': _("You must be logged in to add comments")}, status=400)
 
 
+def comment_page(request, post_slug):
+    post = get_object_or_404(Women.published, slug=post_slug)
+    try:
+        number = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        number = 1
+    html, next_url = get_page(post, request.user, number)
+    return JsonResponse({"html": html, "next": next_url})
+
+
+def comment_replies(request, post_slug, comment_id):
+    post = get_object_or_404(Women.published, slug=post_slug)
+    return JsonResponse({"html": get_replies(post, request.user, comment_id)})
+
+
 def edit_comment(request, post_id, comment_id):
     comment = get_object_or_404(Comment, pk=comment_id)
     post = get_object_or_404(Women, pk=post_id, is_published=Women.Status.PUBLISHED)
@@ -299,7 +323,7 @@ def edit_comment(request, post_id, comment_id):
             comment.body_be = comment.body
             comment.is_updated = True
             comment.save()
-            translate_model_content.delay("Comment", "body", comment.pk)
+            schedule_translation("Comment", "body", comment.pk)
             messages.success(request, _("Comment successfully updated."))
             url = reverse("post", args=(post.slug,))
             return redirect(url)
@@ -310,27 +334,26 @@ def edit_comment(request, post_id, comment_id):
 class RatingCreateView(View):
     model = Rating
 
+    def get_votes(self):
+        """Either one vote as form data, or {"votes": [{"post_id": ..., "value": ...}, ...]} as JSON."""
+        if self.request.content_type == "application/json":
+            return [(int(vote["post_id"]), int(vote["value"])) for vote in json.loads(self.request.body)["votes"]]
+        return [(int(self.request.POST.get('post_id')), int(self.request.POST.get('value')))]
+
     def post(self, request, *args, **kwargs):
-        post_id = request.POST.get('post_id')
-        value = int(request.POST.get('value'))
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        ip = x_forwarded_for.split(',')[0] if x_forwarded_for else request.META.get('REMOTE_ADDR')
-        ip_address = ip
-        user = request.user if request.user.is_authenticated else None
-
-        rating, created = self.model.objects.get_or_create(
-           post_id=post_id,
-            ip_address=ip_address,
-            defaults={'value': value, 'user': user},
-        )
-
-        if not created:
-            if rating.value == value:
-                rating.delete()
-                return JsonResponse({'value': None, 'status': 'deleted', 'rating_sum': rating.post.get_sum_rating()})
-            else:
-                rating.value = value
-                rating.user = user
-                rating.save()
-                return JsonResponse({'value': value, 'status': 'updated', 'rating_sum': rating.post.get_sum_rating()})
-        return JsonResponse({'value': rating.value,'status': 'created', 'rating_sum': rating.post.get_sum_rating()})
\ No newline at end of file
+        ip_address = get_client_ip(request)
+
+        try:
+            votes = self.get_votes()
+        except (KeyError, TypeError, ValueError):
+            return JsonResponse({'error': _("Invalid vote.")}, status=400)
+        if not votes or len(votes) > MAX_BATCH or any(value not in (1, -1) for _, value in votes):
+            return JsonResponse({'error': _("Invalid vote.")}, status=400)
+
+        results = cast_votes(votes, ip_address, request.user)
+        if request.content_type == "application/json":
+            return JsonResponse({'results': results})
+        result = results[0]
+        if result['status'] == 'not_found':
+            return JsonResponse({'error': _("Post not found.")}, status=404)
+        return JsonResponse({'value': result['value'], 'status': result['status'], 'rating_sum': result['rating_sum']})
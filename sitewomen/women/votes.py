@@ -0,0 +1,71 @@
+from django.db import connection, transaction
+
+from .counters import forget
+from .models import Women
+from . import trending
+
+MAX_BATCH = 50
+
+# Toggles the vote of an ip address for a post and keeps the post's counters in step, in one round trip.
+# A second vote with the same value removes the vote; a different value replaces it. Values are 1 and -1,
+# so a replaced vote always had the opposite value.
+CAST_VOTE = """
+    WITH existing AS (
+        SELECT id, value FROM women_rating
+        WHERE post_id = %(post_id)s AND ip_address = %(ip_address)s
+        FOR UPDATE
+    ), removed AS (
+        DELETE FROM women_rating r USING existing e
+        WHERE r.id = e.id AND e.value = %(value)s
+        RETURNING r.value
+    ), written AS (
+        INSERT INTO women_rating (post_id, ip_address, value, user_id, time_create)
+        SELECT %(post_id)s, %(ip_address)s, %(value)s, %(user_id)s, now()
+        WHERE NOT EXISTS (SELECT 1 FROM existing WHERE value = %(value)s)
+        ON CONFLICT (post_id, ip_address) DO UPDATE
+            SET value = EXCLUDED.value, user_id = EXCLUDED.user_id
+            WHERE women_rating.value <> EXCLUDED.value
+        RETURNING value, (xmax = 0) AS inserted
+    ), changes AS (
+        SELECT value, -1 AS delta FROM removed
+        UNION ALL SELECT value, 1 FROM written
+        UNION ALL SELECT -value, -1 FROM written WHERE NOT inserted
+    ), counters AS (
+        UPDATE women_women SET
+            likes = likes + COALESCE((SELECT SUM(delta) FROM changes WHERE value = 1), 0),
+            dislikes = dislikes + COALESCE((SELECT SUM(delta) FROM changes WHERE value = -1), 0)
+        WHERE id = %(post_id)s AND EXISTS (SELECT 1 FROM changes)
+        RETURNING likes - dislikes AS rating_sum
+    )
+    SELECT
+        CASE WHEN EXISTS (SELECT 1 FROM removed) THEN 'deleted'
+             WHEN EXISTS (SELECT 1 FROM written WHERE inserted) THEN 'created'
+             WHEN EXISTS (SELECT 1 FROM written) THEN 'updated'
+             ELSE 'unchanged' END,
+        COALESCE((SELECT rating_sum FROM counters),
+                 (SELECT likes - dislikes FROM women_women WHERE id = %(post_id)s))
+"""
+
+
+def cast_votes(votes, ip_address, user=None) -> list[dict]:
+    """Apply (post_id, value) votes in order and return the outcome of each one.
+
+    Votes for posts that are not published are reported as "not_found".
+    """
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    post_ids = set(Women.published.filter(pk__in={post_id for post_id, _ in votes}).values_list("pk", flat=True))
+    results = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for post_id, value in votes:
+            if post_id not in post_ids:
+                results.append({"post_id": post_id, "value": None, "status": "not_found", "rating_sum": None})
+                continue
+            cursor.execute(CAST_VOTE, {"post_id": post_id, "ip_address": ip_address,
+                                       "value": value, "user_id": user_id})
+            status, rating_sum = cursor.fetchone()
+            results.append({"post_id": post_id, "value": None if status == "deleted" else value,
+                            "status": status, "rating_sum": rating_sum})
+        trending.add_events({result["post_id"]: {"likes" if result["value"] == 1 else "dislikes": 1}
+                             for result in results if result["status"] in ("created", "updated")})
+        forget(*post_ids)
+    return results